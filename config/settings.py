@@ -55,6 +55,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "store.routers.ReplicaPinningMiddleware",
 ]
 
 INTERNAL_IPS = [
@@ -95,6 +96,17 @@ DATABASES = {
     }
 }
 
+# Stand-in replica for the router tests, which list it in DATABASE_REPLICAS
+# against a test database of its own. Nothing reads from it otherwise.
+DATABASES["replica"] = {**DATABASES["default"], "TEST": {"NAME": "test_store2_replica"}}
+
+# Aliases in DATABASES that replicate "default"; catalog reads go there.
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ["store.routers.PrimaryReplicaRouter"]
+DATABASE_REPLICA_PIN_SECONDS = 5
+DATABASE_REPLICA_MAX_LAG = 5
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -140,13 +152,43 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "core.CustomUser"
 
+EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
+DEFAULT_FROM_EMAIL = "store@localhost"
+
 REST_FRAMEWORK = {
     "COERCE_DECIMAL_TO_STRING": False,
+    # The orjson renderer and parser fall back to the stock JSON ones when
+    # orjson is not installed.
+    "DEFAULT_RENDERER_CLASSES": (
+        "store.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "store.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
+    # Token buckets: "anon"/"user" cover every API request, the other
+    # scopes only count writes to views with a matching throttle_scope.
+    "DEFAULT_THROTTLE_CLASSES": (
+        "store.throttling.AnonTokenBucketThrottle",
+        "store.throttling.UserTokenBucketThrottle",
+        "store.throttling.ScopedWriteTokenBucketThrottle",
+    ),
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": "300/min",
+        "user": "1200/min",
+        "carts": "60/min",
+        "orders": "30/min",
+    },
 }
 
+THROTTLE_SYNC_BATCH = 20
+THROTTLE_SYNC_INTERVAL = 1
+
 from datetime import timedelta
 
 
@@ -156,6 +198,20 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=10),
 }
 
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+UNPAID_ORDER_TTL = timedelta(hours=24)
+
+ORDER_ARCHIVE_AFTER = timedelta(days=180)
+
+COMMENT_MODERATION_LEASE = timedelta(minutes=10)
+
+PRIVATE_EMAIL_SEND_LEASE = timedelta(minutes=10)
+
+PRODUCT_PRICE_FACET_BUCKETS = [0, 10, 50, 100, 500]
+PRODUCT_FACETS_CACHE_TIMEOUT = 60
+PRODUCT_AUTOCOMPLETE_MAX_AGE = timedelta(minutes=30)
+
 DJOSER = {
     "SERIALIZERS": {
         "user_create": "core.serializers.UserCreateSerializer",
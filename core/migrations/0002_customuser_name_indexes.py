@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("core", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="customuser",
+            index=models.Index(
+                fields=["last_name"], name="core_custom_last_na_c2b796_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customuser",
+            index=models.Index(
+                fields=["first_name"], name="core_custom_first_n_9782a8_idx"
+            ),
+        ),
+    ]
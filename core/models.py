@@ -4,4 +4,10 @@ from django.contrib.auth.models import AbstractUser
 
 
 class CustomUser(AbstractUser):
-    email = models.EmailField(unique=True)
\ No newline at end of file
+    email = models.EmailField(unique=True)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=["last_name"]),
+            models.Index(fields=["first_name"]),
+        ]
@@ -1,10 +1,74 @@
+from django import forms
 from django.contrib import admin, messages
-from django.db.models import Count
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import HttpResponseRedirect
 from django.utils.html import format_html
-from django.urls import reverse
+from django.urls import path, reverse
 from django.utils.http import urlencode
 
 from . import models
+from .exports import stream_csv
+from .paginations import EstimatedCountPaginator
+
+
+def count_related(model, field_name):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field_name: OuterRef("pk")})
+            .order_by()
+            .values(field_name)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+class CsvExportMixin:
+    change_list_template = "admin/store/export_change_list.html"
+    csv_export_fields = {}
+    csv_export_chunk_size = 2000
+
+    def get_urls(self):
+        opts = self.model._meta
+        return [
+            path(
+                "export/",
+                self.admin_site.admin_view(self.export_view),
+                name=f"{opts.app_label}_{opts.model_name}_export",
+            ),
+        ] + super().get_urls()
+
+    def export_view(self, request):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            querysets = self.get_export_querysets(request)
+        except IncorrectLookupParameters:
+            opts = self.model._meta
+            return HttpResponseRedirect(
+                reverse(f"admin:{opts.app_label}_{opts.model_name}_changelist") + "?e=1"
+            )
+        return self.export_csv(*querysets)
+
+    def get_export_querysets(self, request):
+        """The changelist's filtered rows, plus any the admin exports with them."""
+        return [self.get_changelist_instance(request).get_queryset(request)]
+
+    @admin.action(description="Export selected as CSV")
+    def export_as_csv(self, request, queryset):
+        return self.export_csv(queryset)
+
+    def export_csv(self, *querysets):
+        return stream_csv(
+            querysets,
+            self.csv_export_fields,
+            f"{self.model._meta.model_name}s.csv",
+            chunk_size=self.csv_export_chunk_size,
+        )
 
 
 @admin.register(models.Category)
@@ -54,16 +118,17 @@ class InventoryFilter(admin.SimpleListFilter):
         ]
 
     def queryset(self, request, queryset):
-        if self.value() == InventoryFilter.LESS_THAN_20:
-            return queryset.filter(inventory__lte=20)
-        if self.value() == InventoryFilter.BETWEEN_20_AND_50:
-            return queryset.filter(inventory__range=(21, 49))
-        if self.value() == InventoryFilter.MORE_THAN_50:
-            return queryset.filter(inventory__gte=50)
+        stock_level = {
+            InventoryFilter.LESS_THAN_20: models.Product.STOCK_LEVEL_LOW,
+            InventoryFilter.BETWEEN_20_AND_50: models.Product.STOCK_LEVEL_MEDIUM,
+            InventoryFilter.MORE_THAN_50: models.Product.STOCK_LEVEL_HIGH,
+        }.get(self.value())
+        if stock_level is not None:
+            return queryset.filter(stock_level=stock_level)
 
 
 @admin.register(models.Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(CsvExportMixin, admin.ModelAdmin):
     list_display = [
         "id",
         "num_of_comments",
@@ -75,6 +140,8 @@ class ProductAdmin(admin.ModelAdmin):
         "datetime_created",
         "datetime_modified",
     ]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_per_page = 10
     list_editable = [
         "unit_price",
@@ -96,6 +163,7 @@ class ProductAdmin(admin.ModelAdmin):
     ]
     actions = [
         "clear_inventory",
+        "export_as_csv",
     ]
     search_fields = [
         "name",
@@ -108,13 +176,20 @@ class ProductAdmin(admin.ModelAdmin):
     autocomplete_fields = [
         "category",
     ]
+    csv_export_fields = {
+        "id": "id",
+        "name": "name",
+        "slug": "slug",
+        "category": "category__title",
+        "unit_price": "unit_price",
+        "inventory": "inventory",
+        "comments": "comments_count",
+        "datetime_created": "datetime_created",
+        "datetime_modified": "datetime_modified",
+    }
 
     def inventory_status(self, product: models.Product):
-        if product.inventory <= 20:
-            return "Low"
-        if product.inventory >= 50:
-            return "High"
-        return "Medium"
+        return product.get_stock_level_display()
 
     @admin.display(
         ordering="category__title",
@@ -126,11 +201,7 @@ class ProductAdmin(admin.ModelAdmin):
         return (
             super()
             .get_queryset(request)
-            .prefetch_related(
-                "comments",
-                "category",
-            )
-            .annotate(comments_count=Count("comments"))
+            .annotate(comments_count=count_related(models.Comment, "product"))
         )
 
     @admin.display(description="# comment", ordering="comments_count")
@@ -150,7 +221,7 @@ class ProductAdmin(admin.ModelAdmin):
 
     @admin.action(description="Clear Inventory")
     def clear_inventory(self, request, queryset):
-        update_count = queryset.update(inventory=0)
+        update_count = queryset.clear_inventory()
         self.message_user(
             request,
             f"{update_count} of products inventory cleared to zero.",
@@ -159,7 +230,7 @@ class ProductAdmin(admin.ModelAdmin):
 
 
 @admin.register(models.Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(CsvExportMixin, admin.ModelAdmin):
     list_display = [
         "id",
         "birth_date",
@@ -167,6 +238,8 @@ class CustomerAdmin(admin.ModelAdmin):
         "email",
         "phone_number",
     ]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_per_page = 5
     list_editable = [
         "birth_date",
@@ -175,10 +248,30 @@ class CustomerAdmin(admin.ModelAdmin):
     list_select_related = [
         "user",
     ]
+    # Only shows the search box; get_search_results uses the search terms.
     search_fields = [
         "user__last_name__istartswith",
         "user__first_name__istartswith",
     ]
+    actions = [
+        "export_as_csv",
+    ]
+    csv_export_fields = {
+        "id": "id",
+        "first_name": "user__first_name",
+        "last_name": "user__last_name",
+        "email": "user__email",
+        "phone_number": "phone_number",
+        "birth_date": "birth_date",
+    }
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return (
+            queryset.filter(pk__in=models.CustomerSearchTerm.search(search_term)),
+            False,
+        )
 
     
     def email(self, customer: models.Customer):
@@ -217,13 +310,45 @@ class CommentAdmin(admin.ModelAdmin):
         "status",
         "datetime_created",
     ]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_per_page = 2
     list_editable = [
         "status",
     ]
+    list_select_related = [
+        "product",
+    ]
+    ordering = [
+        "-datetime_created",
+    ]
     autocomplete_fields = [
         "product",
     ]
+    actions = [
+        "approve_comments",
+        "reject_comments",
+    ]
+
+    @admin.action(description="Approve selected comments")
+    def approve_comments(self, request, queryset):
+        comment_ids = list(queryset.values_list("pk", flat=True))
+        self.moderate(request, approved_ids=comment_ids)
+
+    @admin.action(description="Reject selected comments")
+    def reject_comments(self, request, queryset):
+        comment_ids = list(queryset.values_list("pk", flat=True))
+        self.moderate(request, rejected_ids=comment_ids)
+
+    def moderate(self, request, approved_ids=(), rejected_ids=()):
+        moderated_count = models.Comment.objects.moderate(
+            request.user, approved_ids=approved_ids, rejected_ids=rejected_ids
+        )
+        self.message_user(
+            request,
+            f"{moderated_count} waiting comments moderated.",
+            messages.SUCCESS,
+        )
 
 
 class OrderItemInline(admin.TabularInline):
@@ -238,8 +363,19 @@ class OrderItemInline(admin.TabularInline):
     max_num = 20
 
 
+class OrderAdminForm(forms.ModelForm):
+    def clean_status(self):
+        status = self.cleaned_data["status"]
+        if self.instance.pk is not None and status != self.instance.status:
+            error = models.Order.get_transition_error(self.instance.status, status)
+            if error:
+                raise forms.ValidationError(error)
+        return status
+
+
 @admin.register(models.Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(CsvExportMixin, admin.ModelAdmin):
+    form = OrderAdminForm
     list_display = [
         "id",
         "customer",
@@ -247,6 +383,8 @@ class OrderAdmin(admin.ModelAdmin):
         "datetime_created",
         "num_of_items",
     ]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_per_page = 5
     list_editable = [
         "status",
@@ -254,16 +392,34 @@ class OrderAdmin(admin.ModelAdmin):
     list_select_related = [
         "customer__user",
     ]
+    list_filter = [
+        "status",
+        "datetime_created",
+    ]
+    ordering = [
+        "-datetime_created",
+    ]
     inlines = [
         OrderItemInline,
     ]
+    actions = [
+        "mark_as_paid",
+        "mark_as_canceled",
+        "export_as_csv",
+    ]
+    csv_export_fields = {
+        "id": "id",
+        "customer_email": "customer__user__email",
+        "status": "status",
+        "items": "items_count",
+        "datetime_created": "datetime_created",
+    }
 
     def get_queryset(self, request):
         return (
             super()
             .get_queryset(request)
-            .prefetch_related("items")
-            .annotate(items_count=Count("items"))
+            .annotate(items_count=count_related(models.OrderItem, "order"))
         )
 
     @admin.display(
@@ -273,26 +429,153 @@ class OrderAdmin(admin.ModelAdmin):
     def num_of_items(self, order: models.Order):
         return order.items_count
 
+    def get_export_querysets(self, request):
+        # Archived orders matching the same filters follow the hot ones, so
+        # an export whose date range reaches past the archive cutoff is
+        # complete. Both admins filter on status and datetime_created.
+        querysets = super().get_export_querysets(request)
+        archive_admin = self.admin_site._registry[models.ArchivedOrder]
+        if archive_admin.has_view_permission(request):
+            querysets += archive_admin.get_export_querysets(request)
+        return querysets
+
+    def get_changelist_form(self, request, **kwargs):
+        return super().get_changelist_form(request, form=OrderAdminForm, **kwargs)
+
+    def save_model(self, request, obj, form, change):
+        if not change or "status" not in form.changed_data:
+            return super().save_model(request, obj, form, change)
+        # The status goes through transition_status so a cancel gives the
+        # stock back; the other changed fields are saved as usual.
+        status = obj.status
+        obj.status = form.initial["status"]
+        other_fields = [name for name in form.changed_data if name != "status"]
+        if other_fields:
+            obj.save(update_fields=other_fields)
+        previous_statuses, changed_ids = models.Order.objects.filter(
+            pk=obj.pk
+        ).transition_status(status)
+        if changed_ids:
+            obj.status = status
+        else:
+            self.message_user(
+                request,
+                models.Order.get_transition_error(previous_statuses[obj.pk], status),
+                messages.ERROR,
+            )
+
+    @admin.action(description="Mark as paid")
+    def mark_as_paid(self, request, queryset):
+        self.transition_status(request, queryset, models.Order.ORDER_STATUS_PAID)
+
+    @admin.action(description="Mark as canceled")
+    def mark_as_canceled(self, request, queryset):
+        self.transition_status(request, queryset, models.Order.ORDER_STATUS_CANCELED)
+
+    def transition_status(self, request, queryset, status):
+        order_ids = list(queryset.values_list("pk", flat=True))
+        previous_statuses, changed_ids = models.Order.objects.filter(
+            pk__in=order_ids
+        ).transition_status(status)
+        self.message_user(
+            request,
+            f"{len(changed_ids)} of {len(previous_statuses)} orders changed to "
+            f"{models.Order(status=status).get_status_display()}.",
+            messages.SUCCESS,
+        )
+
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = models.ArchivedOrderItem
+    fields = [
+        "product_name",
+        "quantity",
+        "unit_price",
+    ]
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+@admin.register(models.ArchivedOrder)
+class ArchivedOrderAdmin(CsvExportMixin, admin.ModelAdmin):
+    list_display = [
+        "id",
+        "customer",
+        "status",
+        "datetime_created",
+        "datetime_archived",
+        "num_of_items",
+    ]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 10
+    list_select_related = [
+        "customer__user",
+    ]
+    list_filter = [
+        "status",
+        "datetime_created",
+    ]
+    ordering = [
+        "-datetime_created",
+    ]
+    inlines = [
+        ArchivedOrderItemInline,
+    ]
+    actions = [
+        "export_as_csv",
+    ]
+    csv_export_fields = {
+        "id": "id",
+        "customer_email": "customer__user__email",
+        "status": "status",
+        "items": "items_count",
+        "datetime_created": "datetime_created",
+        "datetime_archived": "datetime_archived",
+    }
+
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(items_count=count_related(models.ArchivedOrderItem, "order"))
+        )
+
+    @admin.display(
+        description="# items",
+        ordering="items_count",
+    )
+    def num_of_items(self, order: models.ArchivedOrder):
+        return order.items_count
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(models.OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
     list_display = [
         "id",
         "order",
-        "product",
+        "product_name",
         "quantity",
         "unit_price",
     ]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_per_page = 5
     list_editable = [
         "quantity",
         "unit_price",
-        "order",
     ]
     list_select_related = [
         "order",
-        "product",
     ]
+    raw_id_fields = ["order"]
     autocomplete_fields = ["product"]
 
 
@@ -313,6 +596,8 @@ class CartAdmin(admin.ModelAdmin):
         "id",
         "created_at",
     ]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_per_page = 10
     inlines = [
         CartItemInline,
@@ -330,10 +615,44 @@ class CartItemAdmin(admin.ModelAdmin):
         "product",
         "quantity",
     ]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_per_page = 5
     list_editable = [
         "quantity",
     ]
 
 
+@admin.register(models.PrivateEmail)
+class PrivateEmailAdmin(admin.ModelAdmin):
+    list_display = [
+        "id",
+        "subject",
+        "datetime_created",
+    ]
+    list_per_page = 10
+
+
+@admin.register(models.PrivateEmailJob)
+class PrivateEmailJobAdmin(admin.ModelAdmin):
+    list_display = [
+        "id",
+        "email",
+        "customer",
+        "status",
+        "attempts",
+        "datetime_sent",
+    ]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 10
+    list_filter = [
+        "status",
+    ]
+    list_select_related = [
+        "email",
+        "customer__user",
+    ]
+
+
 # admin.site.register(models.Product, ProductAdmin)
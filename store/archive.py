@@ -0,0 +1,48 @@
+from django.db.models import Value
+
+
+class HotArchiveUnion:
+    """
+    Rows of a hot queryset and its archive counterpart as one sequence,
+    newest first. Slicing runs a single UNION over the keys and then
+    loads just that page from each side, so it can be paginated.
+    """
+
+    ordering = ["-datetime_created", "-id"]
+
+    def __init__(self, hot, archived):
+        self.hot = hot
+        self.archived = archived
+
+    def count(self):
+        return self.hot.order_by().count() + self.archived.order_by().count()
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index : index + 1][0]
+
+        keys = list(
+            self.keys(self.hot, False)
+            .union(self.keys(self.archived, True), all=True)
+            .order_by(*self.ordering)[index]
+        )
+        hot = self.hot.in_bulk([pk for pk, created, archived in keys if not archived])
+        archived = self.archived.in_bulk(
+            [pk for pk, created, archived in keys if archived]
+        )
+        return [
+            (archived if is_archived else hot)[pk] for pk, created, is_archived in keys
+        ]
+
+    def keys(self, queryset, archived):
+        return (
+            queryset.order_by()
+            .prefetch_related(None)
+            .values_list("id", "datetime_created", Value(archived))
+        )
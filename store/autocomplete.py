@@ -0,0 +1,193 @@
+import bisect
+import heapq
+import threading
+import time
+import uuid
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+
+from .models import Product
+from .text import normalize
+
+VERSION_CACHE_KEY = "store:product-autocomplete-version"
+VERSION_CHECK_INTERVAL = 1.0
+
+# Rankings for prefixes up to this length are memoized on first use, since
+# their match ranges can cover a large part of the catalog.
+RANKED_PREFIX_LENGTH = 3
+MAX_RESULTS = 20
+MAX_KEY_LENGTH = 24
+# Keys are grouped in blocks that remember their MAX_RESULTS most popular
+# products, so ranking a match range reads the blocks it fully covers
+# instead of every key in them.
+BLOCK_SIZE = 256
+
+
+class ProductNameIndex:
+    """
+    A sorted array of normalized product names, with one key for every
+    word start, so "shirt" also finds "Blue Shirt". Products are numbered
+    by popularity (rank 0 is the most popular) and keys point at ranks.
+    """
+
+    def __init__(self, products):
+        self.ids = array("q")
+        self.names = []
+        self.popularity = array("q")
+        entries = []
+        for product_id, name, popularity in products:
+            position = len(self.names)
+            self.ids.append(product_id)
+            self.names.append(name)
+            self.popularity.append(popularity)
+            normalized = normalize(name)
+            for start in self.word_starts(normalized):
+                entries.append((normalized[start : start + MAX_KEY_LENGTH], position))
+        entries.sort()
+        self.keys = [key for key, position in entries]
+
+        by_rank = sorted(
+            range(len(self.names)),
+            key=lambda position: (-self.popularity[position], position),
+        )
+        self.positions_by_rank = array("l", by_rank)
+        rank_of = array("l", [0]) * len(by_rank)
+        for rank, position in enumerate(by_rank):
+            rank_of[position] = rank
+        self.ranks = array("l", [rank_of[position] for key, position in entries])
+        self.block_tops = [
+            heapq.nsmallest(MAX_RESULTS, set(self.ranks[i : i + BLOCK_SIZE]))
+            for i in range(0, len(self.ranks), BLOCK_SIZE)
+        ]
+        self.ranked = {}
+
+    @staticmethod
+    def word_starts(normalized):
+        yield 0
+        for i, char in enumerate(normalized):
+            if char == " ":
+                yield i + 1
+
+    def search(self, query, limit=10):
+        query = normalize(query)
+        if not query:
+            return []
+        limit = min(limit, MAX_RESULTS)
+
+        if len(query) <= RANKED_PREFIX_LENGTH:
+            if query not in self.ranked:
+                self.ranked[query] = self.rank(self.match(query), MAX_RESULTS)
+            positions = self.ranked[query][:limit]
+        elif len(query) <= MAX_KEY_LENGTH:
+            positions = self.rank(self.match(query), limit)
+        else:
+            # Keys are cut at MAX_KEY_LENGTH, so the names are checked in
+            # full; ranges this specific are small.
+            low, high = self.match(query[:MAX_KEY_LENGTH])
+            ranks = {
+                rank
+                for rank in set(self.ranks[low:high])
+                if f" {query}"
+                in f" {normalize(self.names[self.positions_by_rank[rank]])}"
+            }
+            positions = [
+                self.positions_by_rank[rank] for rank in heapq.nsmallest(limit, ranks)
+            ]
+        return [
+            {"id": self.ids[position], "name": self.names[position]}
+            for position in positions
+        ]
+
+    def match(self, key):
+        low = bisect.bisect_left(self.keys, key)
+        return low, bisect.bisect_left(self.keys, key + "\U0010ffff", low)
+
+    def rank(self, key_range, limit):
+        """The `limit` most popular products among the keys in the range."""
+        low, high = key_range
+        first_block = -(-low // BLOCK_SIZE)
+        last_block = high // BLOCK_SIZE
+        if first_block >= last_block:
+            ranks = set(self.ranks[low:high])
+        else:
+            ranks = set(self.ranks[low : first_block * BLOCK_SIZE])
+            ranks.update(self.ranks[last_block * BLOCK_SIZE : high])
+            for block_top in self.block_tops[first_block:last_block]:
+                ranks.update(block_top)
+        return [self.positions_by_rank[rank] for rank in heapq.nsmallest(limit, ranks)]
+
+    @classmethod
+    def build(cls):
+        return cls(
+            Product.objects.annotate(popularity=Count("order_items"))
+            .order_by()
+            .values_list("id", "name", "popularity")
+            .iterator(chunk_size=10000)
+        )
+
+
+_index = None
+_index_version = None
+_built_at = 0.0
+_checked_at = 0.0
+_rebuilding = False
+_lock = threading.Lock()
+
+
+def invalidate():
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def get_index():
+    """
+    Returns this process's index, rebuilding it when another process (or a
+    signal in this one) has bumped the shared version key, or when it is
+    older than PRODUCT_AUTOCOMPLETE_MAX_AGE so popularity follows new
+    orders. A stale index keeps answering while the new one is built in
+    the background.
+    """
+    global _checked_at, _rebuilding
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < VERSION_CHECK_INTERVAL:
+        return _index
+
+    _checked_at = now
+    version = cache.get_or_set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+    if (
+        _index is not None
+        and version == _index_version
+        and now - _built_at < settings.PRODUCT_AUTOCOMPLETE_MAX_AGE.total_seconds()
+    ):
+        return _index
+
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _rebuild(version)
+        return _index
+
+    with _lock:
+        if not _rebuilding:
+            _rebuilding = True
+            threading.Thread(target=_rebuild_in_background, args=[version]).start()
+    return _index
+
+
+def _rebuild(version):
+    global _index, _index_version, _built_at
+    _index = ProductNameIndex.build()
+    _index_version = version
+    _built_at = time.monotonic()
+
+
+def _rebuild_in_background(version):
+    global _rebuilding
+    try:
+        _rebuild(version)
+    finally:
+        _rebuilding = False
+        connection.close()
@@ -21,5 +21,32 @@ class ProductFilter(filters.FilterSet):
         fields = {
             "inventory": ["gt", "lt"],
         }
-    
-  
\ No newline at end of file
+
+
+class CustomerFilter(filters.FilterSet):
+    first_name = filters.CharFilter(
+        field_name="user__first_name", lookup_expr="istartswith"
+    )
+    last_name = filters.CharFilter(
+        field_name="user__last_name", lookup_expr="istartswith"
+    )
+    birth_date = filters.DateFromToRangeFilter(field_name="birth_date")
+    search = filters.CharFilter(method="filter_search")
+
+    class Meta:
+        model = models.Customer
+        fields = []
+
+    def filter_search(self, queryset, name, value):
+        return queryset.filter(pk__in=models.CustomerSearchTerm.search(value))
+
+
+class OrderFilter(filters.FilterSet):
+    status = filters.ChoiceFilter(choices=models.Order.ORDER_STATUS)
+    created = filters.IsoDateTimeFromToRangeFilter(field_name="datetime_created")
+
+    class Meta:
+        model = models.Order
+        fields = [
+            "customer",
+        ]
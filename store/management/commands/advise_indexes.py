@@ -0,0 +1,239 @@
+import re
+from collections import defaultdict
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken
+
+DEFAULT_URLS = [
+    "/store/products/",
+    "/store/products/?price_min=10&price_max=100",
+    "/store/products/?inventory__lt=10&ordering=unit_price",
+    "/store/products/?inventory__gt=0&ordering=-inventory",
+    "/store/products/?facets=true",
+    "/store/products/1/comments/",
+    "/store/orders/?status=u",
+    "/store/comments/?status=w",
+    "/admin/store/product/?Inventory=%3C%3D20",
+    "/admin/store/order/?status__exact=u",
+    "/admin/store/comment/?status__exact=w",
+    "/admin/store/cart/",
+]
+
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LIST_RE = re.compile(r"\bIN \(\?(?:, \?)*\)")
+LOG_LINE_RE = re.compile(r"^\([\d.]+\) (?P<sql>.*?)(?:; args=.*)?$")
+NAME = r"[\"`]?(\w+)[\"`]?"
+TABLE_RE = re.compile(rf"\b(?:FROM|JOIN) {NAME}(?: (?:AS )?(?!ON\b|WHERE\b)(\w+))?")
+PREDICATE_RE = re.compile(
+    rf"{NAME}\.{NAME} (=|IN|<=|>=|<|>|BETWEEN|LIKE)(?= )", re.IGNORECASE
+)
+ORDER_BY_RE = re.compile(r"\bORDER BY (.+?)(?: LIMIT\b| OFFSET\b| FOR UPDATE\b|\)|$)")
+COLUMN_RE = re.compile(rf"{NAME}\.{NAME}")
+
+
+def normalize(sql):
+    sql = IN_LIST_RE.sub("IN (...)", LITERAL_RE.sub("?", sql))
+    return " ".join(sql.split())
+
+
+class Command(BaseCommand):
+    help = (
+        "Capture the queries issued by a representative request set (or a "
+        "recorded SQL log), group them by shape, EXPLAIN them and propose "
+        "composite indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            action="append",
+            dest="urls",
+            help="Request path to replay; repeatable. Defaults to the store hot paths.",
+        )
+        parser.add_argument(
+            "--log",
+            help="File with one SQL statement per line, e.g. a django.db.backends log.",
+        )
+        parser.add_argument(
+            "--username", help="Replay requests as this user (default: a superuser)."
+        )
+        parser.add_argument("--host", default="localhost")
+        parser.add_argument("--top", type=int, default=10)
+        parser.add_argument("--no-explain", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["log"]:
+            statements = self.read_log(options["log"])
+        else:
+            statements = self.capture(options)
+        shapes = self.group(statements)
+        if not shapes:
+            raise CommandError("No SELECT queries were captured.")
+
+        ranked = sorted(shapes.values(), key=lambda s: s["time"], reverse=True)
+        self.stdout.write(self.style.MIGRATE_HEADING("Query shapes by total time:"))
+        for shape in ranked[: options["top"]]:
+            self.stdout.write(
+                f"{shape['count']:>6}x {shape['time'] * 1000:>9.1f}ms  {shape['shape'][:200]}"
+            )
+            if not options["no_explain"]:
+                for line in self.explain(shape["sql"]):
+                    self.stdout.write(f"{'':18}{line}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Proposed indexes:"))
+        proposals = self.propose(ranked)
+        if not proposals:
+            self.stdout.write("  Existing indexes cover the captured workload.")
+        for (model, fields), stats in sorted(
+            proposals.items(), key=lambda item: item[1]["time"], reverse=True
+        ):
+            self.stdout.write(
+                f"  {model._meta.label}: models.Index(fields={list(fields)!r})"
+                f"  # {stats['count']} queries, {stats['time'] * 1000:.1f}ms"
+            )
+
+    def read_log(self, path):
+        statements = []
+        with open(path) as log:
+            for line in log:
+                match = LOG_LINE_RE.match(line.strip())
+                sql = match["sql"] if match else line.strip()
+                if sql:
+                    statements.append((sql, 0.0))
+        return statements
+
+    def capture(self, options):
+        user_model = get_user_model()
+        if options["username"]:
+            user = user_model.objects.get(username=options["username"])
+        else:
+            user = user_model.objects.filter(is_superuser=True).first()
+        client = Client(HTTP_HOST=options["host"])
+        if user is not None:
+            client.force_login(user)
+            client.defaults["HTTP_AUTHORIZATION"] = f"JWT {AccessToken.for_user(user)}"
+
+        statements = []
+        for url in options["urls"] or DEFAULT_URLS:
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+            if response.status_code >= 400:
+                self.stderr.write(f"{url} returned {response.status_code}")
+            statements.extend((query["sql"], float(query["time"])) for query in queries)
+        return statements
+
+    def group(self, statements):
+        shapes = {}
+        for sql, duration in statements:
+            if not sql.lstrip().upper().startswith("SELECT"):
+                continue
+            shape = normalize(sql)
+            stats = shapes.setdefault(
+                shape, {"shape": shape, "sql": sql, "count": 0, "time": 0.0}
+            )
+            stats["count"] += 1
+            stats["time"] += duration
+        return shapes
+
+    def explain(self, sql):
+        prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql)
+                return [" | ".join(str(value) for value in row) for row in cursor]
+        except DatabaseError as e:
+            return [f"EXPLAIN failed: {e}"]
+
+    def propose(self, shapes):
+        models_by_table = {model._meta.db_table: model for model in apps.get_models()}
+        with connection.cursor() as cursor:
+            tables = connection.introspection.table_names(cursor)
+            existing = {
+                table: list(
+                    connection.introspection.get_constraints(cursor, table).values()
+                )
+                for table in models_by_table
+                if table in tables
+            }
+
+        proposals = defaultdict(lambda: {"count": 0, "time": 0.0})
+        for shape in shapes:
+            candidates = self.candidate_columns(shape["shape"])
+            for table, (columns, equal_count) in candidates.items():
+                model = models_by_table.get(table)
+                if model is None:
+                    continue
+                # InnoDB appends the primary key to every secondary index.
+                if columns[-1] == model._meta.pk.column:
+                    columns = columns[:-1]
+                equal_count = min(equal_count, len(columns))
+                if not columns or self.is_covered(
+                    existing.get(table, []), columns, equal_count
+                ):
+                    continue
+                fields_by_column = {
+                    f.column: f.name for f in model._meta.concrete_fields
+                }
+                fields = tuple(fields_by_column.get(c, c) for c in columns)
+                proposals[(model, fields)]["count"] += shape["count"]
+                proposals[(model, fields)]["time"] += shape["time"]
+        return proposals
+
+    def is_covered(self, constraints, columns, equal_count):
+        for constraint in constraints:
+            index = constraint["columns"]
+            if (
+                equal_count
+                and (constraint["unique"] or constraint["primary_key"])
+                and set(index) <= set(columns[:equal_count])
+            ):
+                return True
+            if not (constraint["index"] or constraint["primary_key"]):
+                continue
+            if (
+                len(index) >= len(columns)
+                and set(index[:equal_count]) == set(columns[:equal_count])
+                and index[equal_count : len(columns)] == columns[equal_count:]
+            ):
+                return True
+        return False
+
+    def candidate_columns(self, shape):
+        """
+        Equality predicates first, then either the first range predicate
+        or the ORDER BY columns of the same table.
+        """
+        aliases = {}
+        for table, alias in TABLE_RE.findall(shape):
+            aliases[table] = table
+            if alias:
+                aliases[alias] = table
+
+        equality, ranges = defaultdict(list), defaultdict(list)
+        for alias, column, operator in PREDICATE_RE.findall(shape):
+            table = aliases.get(alias, alias)
+            target = equality if operator.upper() in ("=", "IN") else ranges
+            if column not in target[table]:
+                target[table].append(column)
+
+        ordering = defaultdict(list)
+        order_by = ORDER_BY_RE.findall(shape)
+        if order_by:
+            for alias, column in COLUMN_RE.findall(order_by[-1]):
+                ordering[aliases.get(alias, alias)].append(column)
+
+        candidates = {}
+        for table in set(equality) | set(ranges) | set(ordering):
+            columns = list(equality[table])
+            if ranges[table]:
+                columns.append(ranges[table][0])
+            else:
+                columns.extend(c for c in ordering[table] if c not in columns)
+            if columns:
+                candidates[table] = (columns, len(equality[table]))
+        return candidates
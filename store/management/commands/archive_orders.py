@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store import models
+
+
+class Command(BaseCommand):
+    help = (
+        "Move paid and canceled orders older than ORDER_ARCHIVE_AFTER, with "
+        "their items, into the archive tables in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        cutoff = models.ArchivedOrder.get_cutoff()
+        started_at = time.monotonic()
+        batch_count = archived_count = 0
+        while True:
+            with transaction.atomic():
+                orders = list(
+                    models.Order.objects.select_for_update(skip_locked=True)
+                    .filter(
+                        status__in=models.ArchivedOrder.ARCHIVABLE_STATUSES,
+                        datetime_created__lt=cutoff,
+                    )
+                    .order_by("datetime_created", "id")
+                    .values("id", "customer_id", "datetime_created", "status")[
+                        : options["batch_size"]
+                    ]
+                )
+                if not orders:
+                    break
+                order_ids = [order["id"] for order in orders]
+                items = models.OrderItem.objects.filter(order_id__in=order_ids)
+
+                models.ArchivedOrder.objects.bulk_create(
+                    models.ArchivedOrder(**order) for order in orders
+                )
+                models.ArchivedOrderItem.objects.bulk_create(
+                    models.ArchivedOrderItem(**item)
+                    for item in items.values(
+                        "id",
+                        "order_id",
+                        "product_id",
+                        "product_name",
+                        "product_slug",
+                        "quantity",
+                        "unit_price",
+                    )
+                )
+                items.delete()
+                models.Order.objects.filter(pk__in=order_ids).delete()
+            batch_count += 1
+            archived_count += len(orders)
+
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(
+            f"{archived_count} orders created before {cutoff:%Y-%m-%d %H:%M} "
+            f"archived in {batch_count} batches, {elapsed:.2f}s."
+        )
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+
+from store import models
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy product name and slug onto order items and archived order "
+        "items created before the snapshot columns existed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for model in [models.OrderItem, models.ArchivedOrderItem]:
+            updated_count = self.backfill(model, options["batch_size"])
+            self.stdout.write(
+                f"{updated_count} {model._meta.verbose_name_plural} backfilled."
+            )
+
+    def backfill(self, model, batch_size):
+        products = models.Product.objects.filter(pk=OuterRef("product_id"))
+        pending = model.objects.filter(product_name="", product__isnull=False)
+        updated_count = 0
+        last_pk = 0
+        while True:
+            item_ids = list(
+                pending.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not item_ids:
+                return updated_count
+            updated_count += model.objects.filter(pk__in=item_ids).update(
+                product_name=Subquery(products.values("name")[:1]),
+                product_slug=Subquery(products.values("slug")[:1]),
+            )
+            last_pk = item_ids[-1]
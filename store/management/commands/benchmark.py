@@ -0,0 +1,164 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.throttling import UserRateThrottle
+
+from store import models, serializers, throttling, views
+from store.renderers import ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = (
+        "Time hot code paths in-process against the configured database. "
+        "Everything written while benchmarking is rolled back."
+    )
+
+    targets = ["checkout", "renderer", "throttle"]
+
+    def add_arguments(self, parser):
+        parser.add_argument("target", choices=self.targets)
+        parser.add_argument("--iterations", type=int, default=50)
+
+    def handle(self, *args, **options):
+        self.iterations = options["iterations"]
+        with transaction.atomic():
+            getattr(self, f"benchmark_{options['target']}")()
+            transaction.set_rollback(True)
+
+    def report(self, label, durations, unit="ms", scale=1000, queries_count=None):
+        median = statistics.median(durations)
+        line = (
+            f"{label}: median {median * scale:.2f}{unit}, "
+            f"{1 / median:,.0f}/s over {len(durations)} runs"
+        )
+        if queries_count is not None:
+            line += f", {queries_count} queries"
+        self.stdout.write(line)
+
+    def create_products(self, count, inventory=0):
+        category = models.Category.objects.create(title="Benchmark")
+        return models.Product.objects.bulk_create(
+            [
+                models.Product(
+                    name=f"Benchmark {i}",
+                    slug=f"benchmark-{i}",
+                    description="",
+                    unit_price=10,
+                    inventory=inventory,
+                    category=category,
+                )
+                for i in range(count)
+            ]
+        )
+
+    def benchmark_checkout(self):
+        user = get_user_model().objects.create_user(username="benchmark-checkout")
+        # Throttling is left out so every iteration reaches the checkout.
+        view = views.OrderViewSet.as_view({"post": "create"}, throttle_classes=[])
+        factory = APIRequestFactory()
+
+        for items_count in [1, 20, 100]:
+            products = self.create_products(
+                items_count, inventory=self.iterations + 100
+            )
+            durations = []
+            for _ in range(self.iterations):
+                cart = models.Cart.objects.create()
+                models.CartItem.objects.bulk_create(
+                    [
+                        models.CartItem(cart=cart, product=product, quantity=1)
+                        for product in products
+                    ]
+                )
+                request = factory.post(
+                    "/store/orders/", {"cart_id": str(cart.id)}, format="json"
+                )
+                force_authenticate(request, user)
+                with CaptureQueriesContext(connection) as queries:
+                    started_at = time.perf_counter()
+                    response = view(request)
+                    durations.append(time.perf_counter() - started_at)
+                if response.status_code != 200:
+                    raise CommandError(f"Checkout failed: {response.data}")
+            self.report(
+                f"checkout {items_count:>3} items",
+                durations,
+                queries_count=len(queries),
+            )
+
+    def benchmark_renderer(self):
+        """Renders a page of 100 admin order payloads with 5 items each."""
+        user = get_user_model().objects.create_user(username="benchmark-renderer")
+        products = self.create_products(5)
+        orders = models.Order.objects.bulk_create(
+            [models.Order(customer=user.customer) for _ in range(100)]
+        )
+        models.OrderItem.objects.bulk_create(
+            [
+                models.OrderItem(
+                    order=order,
+                    product=product,
+                    product_name=product.name,
+                    product_slug=product.slug,
+                    quantity=2,
+                    unit_price=product.unit_price,
+                )
+                for order in orders
+                for product in products
+            ]
+        )
+        data = serializers.OrderForAdminSerializer(
+            models.Order.objects.select_related("customer__user").prefetch_related(
+                "items"
+            ),
+            many=True,
+        ).data
+
+        for renderer in [JSONRenderer(), ORJSONRenderer()]:
+            durations = []
+            for _ in range(self.iterations):
+                started_at = time.perf_counter()
+                body = renderer.render(data, "application/json")
+                durations.append(time.perf_counter() - started_at)
+            self.report(
+                f"{type(renderer).__name__} {len(body):,} bytes",
+                durations,
+                unit="µs",
+                scale=1_000_000,
+            )
+
+    def benchmark_throttle(self):
+        """
+        Per-request overhead of the token bucket next to DRF's cache-backed
+        throttle, both at the configured "user" rate. Requests past the rate
+        are denied, and those decisions are timed too.
+        """
+
+        class RateThrottle(UserRateThrottle):
+            rate = api_settings.DEFAULT_THROTTLE_RATES["user"]
+
+        request = Request(APIRequestFactory().get("/store/products/"))
+        request.user = get_user_model()(pk=0, username="benchmark-throttle")
+        for label, throttle in [
+            ("UserRateThrottle", RateThrottle()),
+            ("UserTokenBucketThrottle", throttling.UserTokenBucketThrottle()),
+        ]:
+            durations = []
+            for _ in range(self.iterations):
+                started_at = time.perf_counter()
+                throttle.allow_request(request, None)
+                durations.append(time.perf_counter() - started_at)
+            self.report(
+                f"{label} at {RateThrottle.rate}",
+                durations,
+                unit="µs",
+                scale=1_000_000,
+            )
@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import models, outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver outbox events to a sink in id order, in batches, and delete "
+        "them once the sink has accepted the batch (at-least-once)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sink",
+            default="file",
+            help="'file', 'http' or the dotted path of a sink class.",
+        )
+        parser.add_argument("--path", default="outbox.ndjson")
+        parser.add_argument("--url", default="http://localhost:8080/events")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the outbox instead of exiting once it is empty.",
+        )
+        parser.add_argument("--sleep", type=float, default=1)
+
+    def handle(self, *args, **options):
+        sink = outbox.get_sink(
+            options["sink"], path=options["path"], url=options["url"]
+        )
+        started_at = time.monotonic()
+        delivered_count = 0
+        try:
+            while True:
+                events = list(
+                    models.OutboxEvent.objects.order_by("id").values(
+                        "id", "topic", "payload", "datetime_created"
+                    )[: options["batch_size"]]
+                )
+                if not events:
+                    if not options["loop"]:
+                        break
+                    time.sleep(options["sleep"])
+                    continue
+
+                try:
+                    sink.send(events)
+                except OSError as e:
+                    if not options["loop"]:
+                        raise CommandError(f"Delivery failed: {e}")
+                    self.stderr.write(f"Delivery failed, retrying: {e}")
+                    time.sleep(options["sleep"])
+                    continue
+
+                # A crash before this delete redelivers the batch.
+                models.OutboxEvent.objects.filter(
+                    id__in=[event["id"] for event in events]
+                ).delete()
+                delivered_count += len(events)
+        finally:
+            sink.close()
+
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(
+            f"{delivered_count} outbox events delivered in {elapsed:.2f}s "
+            f"({delivered_count / elapsed if elapsed else 0:.0f} events/s)."
+        )
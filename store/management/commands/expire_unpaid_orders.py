@@ -0,0 +1,66 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from store import models
+
+
+class Command(BaseCommand):
+    help = (
+        "Cancel unpaid orders older than UNPAID_ORDER_TTL in batches "
+        "and give their items back to the product inventory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ttl-minutes",
+            type=int,
+            help="Override UNPAID_ORDER_TTL for this run.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        ttl = settings.UNPAID_ORDER_TTL
+        if options["ttl_minutes"] is not None:
+            ttl = timedelta(minutes=options["ttl_minutes"])
+        cutoff = timezone.now() - ttl
+
+        started_at = time.monotonic()
+        batch_count = canceled_count = 0
+        last_seen = None
+        while True:
+            # Walk (status, datetime_created) in keyset order so rows skipped
+            # because another worker holds their lock are not revisited.
+            queryset = models.Order.unpaid_orders.filter(datetime_created__lt=cutoff)
+            if last_seen is not None:
+                last_created, last_id = last_seen
+                queryset = queryset.filter(
+                    Q(datetime_created__gt=last_created)
+                    | Q(datetime_created=last_created, id__gt=last_id)
+                )
+            with transaction.atomic():
+                batch = list(
+                    queryset.select_for_update(skip_locked=True)
+                    .order_by("datetime_created", "id")
+                    .values_list("datetime_created", "id")[: options["batch_size"]]
+                )
+                if not batch:
+                    break
+                previous_statuses, changed_ids = models.Order.objects.filter(
+                    pk__in=[order_id for created, order_id in batch]
+                ).transition_status(models.Order.ORDER_STATUS_CANCELED)
+            last_seen = batch[-1]
+            batch_count += 1
+            canceled_count += len(changed_ids)
+
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(
+            f"{canceled_count} unpaid orders created before {cutoff:%Y-%m-%d %H:%M} "
+            f"canceled in {batch_count} batches, {elapsed:.2f}s "
+            f"({canceled_count / elapsed if elapsed else 0:.0f} orders/s)."
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store import models
+
+
+class Command(BaseCommand):
+    help = "Delete expired checkout idempotency keys in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        deleted_count = 0
+        while True:
+            key_ids = list(
+                models.IdempotencyKey.objects.filter(expires_at__lte=now)
+                .order_by("expires_at")
+                .values_list("id", flat=True)[: options["batch_size"]]
+            )
+            if not key_ids:
+                break
+            models.IdempotencyKey.objects.filter(id__in=key_ids).delete()
+            deleted_count += len(key_ids)
+        self.stdout.write(f"{deleted_count} expired idempotency keys deleted.")
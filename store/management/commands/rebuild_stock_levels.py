@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from store import models
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute product stock levels and the per-level counts, e.g. after "
+        "products were imported with bulk_create or raw SQL."
+    )
+
+    def handle(self, *args, **options):
+        models.StockLevelCount.rebuild()
+        for level_count in models.StockLevelCount.objects.order_by("stock_level"):
+            self.stdout.write(
+                f"{level_count.get_stock_level_display()}: "
+                f"{level_count.products_count} products"
+            )
@@ -0,0 +1,153 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.template import Context, Template
+from django.utils import timezone
+
+from store import models
+
+
+class Command(BaseCommand):
+    help = "Send queued private emails in batches with a pool of worker threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--max-attempts", type=int, default=3)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the queue instead of exiting once it is empty.",
+        )
+        parser.add_argument("--sleep", type=float, default=5)
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        self.max_attempts = options["max_attempts"]
+        while True:
+            started_at = time.monotonic()
+            with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+                results = list(
+                    executor.map(lambda _: self.run_worker(), range(options["workers"]))
+                )
+            sent_count = sum(sent for sent, failed in results)
+            failed_count = sum(failed for sent, failed in results)
+            if sent_count or failed_count:
+                self.stdout.write(
+                    f"{sent_count} sent, {failed_count} failed "
+                    f"in {time.monotonic() - started_at:.2f}s"
+                )
+            if not options["loop"]:
+                return
+            if not sent_count and not failed_count:
+                time.sleep(options["sleep"])
+
+    def run_worker(self):
+        sent_count = failed_count = 0
+        try:
+            while True:
+                jobs = self.claim_batch()
+                if not jobs:
+                    return sent_count, failed_count
+                sent, failed, reachable = self.send_batch(jobs)
+                sent_count += sent
+                failed_count += failed
+                if not reachable:
+                    # Leave the requeued jobs for the next run instead of
+                    # spending their attempts while the server is down.
+                    return sent_count, failed_count
+        finally:
+            connection.close()
+
+    def claim_batch(self):
+        now = timezone.now()
+        # Jobs whose worker died mid-send are claimed again once their lease
+        # runs out, unless they have used up their attempts.
+        expired = Q(
+            status=models.PrivateEmailJob.JOB_STATUS_SENDING, claimed_until__lt=now
+        )
+        with transaction.atomic():
+            models.PrivateEmailJob.objects.filter(
+                expired, attempts__gte=self.max_attempts
+            ).update(
+                status=models.PrivateEmailJob.JOB_STATUS_FAILED,
+                claimed_until=None,
+                error="The worker sending this email stopped before it finished.",
+            )
+            job_ids = list(
+                models.PrivateEmailJob.objects.select_for_update(skip_locked=True)
+                .filter(Q(status=models.PrivateEmailJob.JOB_STATUS_PENDING) | expired)
+                .order_by("id")
+                .values_list("id", flat=True)[: self.batch_size]
+            )
+            models.PrivateEmailJob.objects.filter(id__in=job_ids).update(
+                status=models.PrivateEmailJob.JOB_STATUS_SENDING,
+                attempts=F("attempts") + 1,
+                claimed_until=now + settings.PRIVATE_EMAIL_SEND_LEASE,
+            )
+        return list(
+            models.PrivateEmailJob.objects.select_related(
+                "email", "customer__user"
+            ).filter(id__in=job_ids)
+        )
+
+    def send_batch(self, jobs):
+        templates = {}
+        sent_ids = []
+        failed_jobs = []
+        reachable = True
+        try:
+            with get_connection() as mail_connection:
+                for job in jobs:
+                    if job.email_id not in templates:
+                        templates[job.email_id] = (
+                            Template(job.email.subject),
+                            Template(job.email.body),
+                        )
+                    subject_template, body_template = templates[job.email_id]
+                    context = Context(
+                        {"customer": job.customer, "user": job.customer.user}
+                    )
+                    message = EmailMessage(
+                        subject=" ".join(subject_template.render(context).split()),
+                        body=body_template.render(context),
+                        to=[job.customer.user.email],
+                        connection=mail_connection,
+                    )
+                    try:
+                        message.send()
+                    except Exception as error:
+                        failed_jobs.append((job, str(error)))
+                    else:
+                        sent_ids.append(job.id)
+        except Exception as error:
+            # The mail server could not be reached; whatever was not sent
+            # goes back to the queue like a failed send.
+            reachable = False
+            handled_ids = set(sent_ids) | {job.id for job, _ in failed_jobs}
+            failed_jobs += [
+                (job, str(error)) for job in jobs if job.id not in handled_ids
+            ]
+
+        models.PrivateEmailJob.objects.filter(id__in=sent_ids).update(
+            status=models.PrivateEmailJob.JOB_STATUS_SENT,
+            datetime_sent=timezone.now(),
+            claimed_until=None,
+            error="",
+        )
+        for job, error in failed_jobs:
+            models.PrivateEmailJob.objects.filter(pk=job.pk).update(
+                status=(
+                    models.PrivateEmailJob.JOB_STATUS_FAILED
+                    if job.attempts >= self.max_attempts
+                    else models.PrivateEmailJob.JOB_STATUS_PENDING
+                ),
+                claimed_until=None,
+                error=error,
+            )
+        return len(sent_ids), len(failed_jobs), reachable
@@ -0,0 +1,107 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+
+from store import models
+
+DEFAULT_URLS = [
+    "/store/products/",
+    "/store/products/?facets=true",
+    "/store/categories/",
+    "/store/products/?page=2",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay the most requested catalog URLs in-process with a bounded "
+        "thread pool so shared caches are warm before workers take traffic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            action="append",
+            dest="urls",
+            help="URL to warm; repeatable.",
+        )
+        parser.add_argument(
+            "--file",
+            help=(
+                "File with one URL per line, optionally prefixed with its "
+                "request count as printed by `sort | uniq -c`."
+            ),
+        )
+        parser.add_argument("--top", type=int, default=50)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--host", default="localhost")
+
+    def handle(self, *args, **options):
+        backend = caches["default"]
+        if isinstance(backend, (LocMemCache, DummyCache)):
+            self.stderr.write(
+                self.style.WARNING(
+                    f"The default cache is {type(backend).__name__}, which web "
+                    "workers don't share with this command, so only the "
+                    "database gets warmed."
+                )
+            )
+        urls = self.get_urls(options)[: options["top"]]
+        self.host = options["host"]
+
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            results = list(executor.map(self.warm, urls))
+        elapsed = time.monotonic() - started_at
+
+        for url, status_code, duration in results:
+            self.stdout.write(f"{status_code} {duration * 1000:>8.1f}ms  {url}")
+        warmed_keys = [
+            key for key in [models.Product.FACETS_CACHE_KEY] if cache.has_key(key)
+        ]
+        ok_count = sum(1 for url, status_code, duration in results if status_code < 400)
+        self.stdout.write(
+            f"{ok_count} of {len(results)} URLs warmed in {elapsed:.2f}s with "
+            f"{options['workers']} workers; cache keys set: "
+            f"{', '.join(warmed_keys) or 'none'}."
+        )
+
+    def get_urls(self, options):
+        if options["urls"]:
+            return options["urls"]
+        if options["file"]:
+            counted_urls = []
+            with open(options["file"]) as url_file:
+                for line in url_file:
+                    parts = line.split()
+                    if len(parts) == 2 and parts[0].isdigit():
+                        counted_urls.append((int(parts[0]), parts[1]))
+                    elif len(parts) == 1:
+                        counted_urls.append((0, parts[0]))
+            counted_urls.sort(key=lambda counted_url: counted_url[0], reverse=True)
+            return [url for count, url in counted_urls]
+
+        # Without recorded traffic, best sellers stand in for the most
+        # viewed product pages.
+        product_ids = (
+            models.Product.objects.annotate(orders_count=Count("order_items"))
+            .order_by("-orders_count", "-id")
+            .values_list("id", flat=True)[: options["top"]]
+        )
+        return DEFAULT_URLS + [f"/store/products/{pk}/" for pk in product_ids]
+
+    def warm(self, url):
+        client = Client(HTTP_HOST=self.host)
+        started_at = time.monotonic()
+        try:
+            response = client.get(url)
+        finally:
+            connection.close()
+        return url, response.status_code, time.monotonic() - started_at
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_alter_customer_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrivateEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('datetime_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PrivateEmailJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('p', 'Pending'), ('s', 'Sending'), ('d', 'Sent'), ('f', 'Failed')], default='p', max_length=1)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('datetime_created', models.DateTimeField(auto_now_add=True)),
+                ('datetime_sent', models.DateTimeField(blank=True, null=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='private_email_jobs', to='store.customer')),
+                ('email', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='store.privateemail')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='store_priva_status_c1ecc2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'datetime_created'], name='store_order_status_399d7c_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_order_status_datetime_created_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['product', 'status', 'datetime_created', 'id'], name='store_comme_product_94df6c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['status', 'datetime_created', 'id'], name='store_comme_status_25d4c5_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0016_comment_moderation_claim"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cart",
+            name="version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
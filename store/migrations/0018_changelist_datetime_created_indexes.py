@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0017_cart_version"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["datetime_created"], name="store_comme_datetim_9cf2ca_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["datetime_created"], name="store_order_datetim_0a5b0f_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["datetime_created"], name="store_produ_datetim_7c5d3d_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0018_changelist_datetime_created_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="cart",
+            index=models.Index(
+                fields=["created_at"], name="store_cart_created_bb94c8_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["inventory"], name="store_produ_invento_b4e03e_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["unit_price"], name="store_produ_unit_pr_d8cb6a_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0019_product_inventory_price_cart_created_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedOrder",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("datetime_created", models.DateTimeField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("p", "Paid"), ("u", "Unpaid"), ("c", "Canceled")],
+                        max_length=1,
+                    ),
+                ),
+                ("datetime_archived", models.DateTimeField(auto_now_add=True)),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="archived_orders",
+                        to="store.customer",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedOrderItem",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("quantity", models.PositiveSmallIntegerField()),
+                ("unit_price", models.DecimalField(decimal_places=2, max_digits=6)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="store.archivedorder",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="archived_order_items",
+                        to="store.product",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="archivedorder",
+            index=models.Index(
+                fields=["datetime_created"], name="store_archi_datetim_9b1c1c_idx"
+            ),
+        ),
+    ]
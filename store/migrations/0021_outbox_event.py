@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:32
+
+import rest_framework.utils.encoders
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0020_order_archive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboxEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("topic", models.CharField(max_length=50)),
+                (
+                    "payload",
+                    models.JSONField(encoder=rest_framework.utils.encoders.JSONEncoder),
+                ),
+                ("datetime_created", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
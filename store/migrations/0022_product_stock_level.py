@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:34
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_stock_levels(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    StockLevelCount = apps.get_model("store", "StockLevelCount")
+    db_alias = schema_editor.connection.alias
+    products = Product.objects.using(db_alias)
+    products.filter(inventory__gte=50).update(stock_level="h")
+    products.filter(inventory__gt=20, inventory__lt=50).update(stock_level="m")
+    counts = dict(
+        products.order_by()
+        .values("stock_level")
+        .annotate(products_count=Count("id"))
+        .values_list("stock_level", "products_count")
+    )
+    StockLevelCount.objects.using(db_alias).bulk_create(
+        StockLevelCount(stock_level=level, products_count=counts.get(level, 0))
+        for level in ["l", "m", "h"]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0021_outbox_event"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockLevelCount",
+            fields=[
+                (
+                    "stock_level",
+                    models.CharField(
+                        choices=[("l", "Low"), ("m", "Medium"), ("h", "High")],
+                        max_length=1,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("products_count", models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="stock_level",
+            field=models.CharField(
+                choices=[("l", "Low"), ("m", "Medium"), ("h", "High")],
+                default="l",
+                editable=False,
+                max_length=1,
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="stock_level_changed_at",
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["stock_level", "stock_level_changed_at"],
+                name="store_produ_stock_l_fb7e8d_idx",
+            ),
+        ),
+        migrations.RunPython(backfill_stock_levels, migrations.RunPython.noop),
+    ]
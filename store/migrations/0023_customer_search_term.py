@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from store.text import normalize
+
+
+def backfill_search_terms(apps, schema_editor):
+    Customer = apps.get_model("store", "Customer")
+    CustomerSearchTerm = apps.get_model("store", "CustomerSearchTerm")
+    db_alias = schema_editor.connection.alias
+    last_pk = 0
+    while True:
+        customers = list(
+            Customer.objects.using(db_alias)
+            .filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list(
+                "pk",
+                "user__first_name",
+                "user__last_name",
+                "user__email",
+                "phone_number",
+            )[:1000]
+        )
+        if not customers:
+            break
+        search_terms = []
+        for pk, first_name, last_name, email, phone_number in customers:
+            first_name, last_name = normalize(first_name), normalize(last_name)
+            terms = {
+                first_name,
+                last_name,
+                f"{first_name} {last_name}",
+                f"{last_name} {first_name}",
+                normalize(email),
+            }
+            digits = "".join(char for char in phone_number if char.isdigit())
+            terms |= {digits, digits.lstrip("0"), digits[-10:]}
+            search_terms += [
+                CustomerSearchTerm(customer_id=pk, term=term.strip()[:255])
+                for term in terms
+                if term.strip()
+            ]
+        CustomerSearchTerm.objects.using(db_alias).bulk_create(search_terms)
+        last_pk = customers[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0022_product_stock_level"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CustomerSearchTerm",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("term", models.CharField(db_index=True, max_length=255)),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_terms",
+                        to="store.customer",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(backfill_search_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0023_customer_search_term"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedorderitem",
+            name="product_name",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="archivedorderitem",
+            name="product_slug",
+            field=models.SlugField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="orderitem",
+            name="product_name",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="orderitem",
+            name="product_slug",
+            field=models.SlugField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name="archivedorderitem",
+            name="product",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="archived_order_items",
+                to="store.product",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="orderitem",
+            name="product",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="order_items",
+                to="store.product",
+            ),
+        ),
+    ]
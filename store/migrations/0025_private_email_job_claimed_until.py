@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0024_order_item_product_snapshot"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="privateemailjob",
+            name="claimed_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
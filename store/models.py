@@ -1,8 +1,19 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Round
+from django.core.cache import cache
 from django.core.validators import MinValueValidator
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+import re
 import uuid
+from collections import Counter
+from decimal import Decimal
+
+from .signals import order_status_changed
+from .text import normalize
 
 
 class Category(models.Model):
@@ -24,7 +35,247 @@ class Discount(models.Model):
         return f"{str(self.discount)} | {self.description}"
 
 
-class Product(models.Model):
+class OutboxEvent(models.Model):
+    """Change event waiting for dispatch_outbox to deliver it downstream."""
+
+    TOPIC_PRODUCT_INVENTORY = "product.inventory"
+    TOPIC_PRODUCT_PRICE = "product.price"
+    TOPIC_ORDER_STATUS = "order.status"
+
+    topic = models.CharField(max_length=50)
+    payload = models.JSONField(encoder=JSONEncoder)
+    datetime_created = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def publish(cls, topic, payloads):
+        return cls.objects.bulk_create(
+            [cls(topic=topic, payload=payload) for payload in payloads]
+        )
+
+
+class OutboxFieldsMixin:
+    """
+    Writes an OutboxEvent in the same transaction as save() whenever one
+    of `outbox_fields` (field name -> topic) changed since it was loaded.
+    """
+
+    outbox_fields = {}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.take_outbox_snapshot()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self.take_outbox_snapshot(fields)
+
+    def take_outbox_snapshot(self, fields=None):
+        # Deferred fields are left out rather than loaded, and refreshing a
+        # deferred field keeps the snapshot of the others.
+        self._outbox_snapshot = {
+            **getattr(self, "_outbox_snapshot", {}),
+            **{
+                name: self.__dict__[name]
+                for name in self.outbox_fields
+                if name in self.__dict__ and (fields is None or name in fields)
+            },
+        }
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+            snapshot = getattr(self, "_outbox_snapshot", {})
+            update_fields = kwargs.get("update_fields")
+            events = [
+                OutboxEvent(
+                    topic=topic,
+                    payload={
+                        "id": self.pk,
+                        name: self.__dict__[name],
+                        f"previous_{name}": snapshot.get(name),
+                    },
+                )
+                for name, topic in self.outbox_fields.items()
+                if name in self.__dict__
+                and (update_fields is None or name in update_fields)
+                and (name not in snapshot or snapshot[name] != self.__dict__[name])
+            ]
+            OutboxEvent.objects.bulk_create(events)
+        self.take_outbox_snapshot()
+
+
+class ProductQuerySet(models.QuerySet):
+    def adjust_inventory(self, deltas):
+        if not deltas:
+            return 0
+        with transaction.atomic():
+            updated_count = self.filter(pk__in=deltas).update(
+                inventory=F("inventory")
+                + Case(
+                    *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+                    output_field=models.IntegerField(),
+                ),
+                datetime_modified=timezone.now(),
+            )
+            products = list(
+                self.filter(pk__in=deltas).values_list("pk", "inventory", "stock_level")
+            )
+            OutboxEvent.publish(
+                OutboxEvent.TOPIC_PRODUCT_INVENTORY,
+                [
+                    {
+                        "id": pk,
+                        "inventory": inventory,
+                        "previous_inventory": inventory - deltas[pk],
+                    }
+                    for pk, inventory, stock_level in products
+                    if deltas[pk]
+                ],
+            )
+            Product.objects.update_stock_levels(
+                {
+                    pk: (stock_level, Product.get_stock_level(inventory))
+                    for pk, inventory, stock_level in products
+                }
+            )
+        return updated_count
+
+    def clear_inventory(self):
+        with transaction.atomic():
+            products = list(
+                self.select_for_update()
+                .order_by("pk")
+                .values_list("pk", "inventory", "stock_level")
+            )
+            updated_count = Product.objects.filter(
+                pk__in=[pk for pk, inventory, stock_level in products]
+            ).update(inventory=0, datetime_modified=timezone.now())
+            OutboxEvent.publish(
+                OutboxEvent.TOPIC_PRODUCT_INVENTORY,
+                [
+                    {"id": pk, "inventory": 0, "previous_inventory": inventory}
+                    for pk, inventory, stock_level in products
+                    if inventory
+                ],
+            )
+            Product.objects.update_stock_levels(
+                {
+                    pk: (stock_level, Product.STOCK_LEVEL_LOW)
+                    for pk, inventory, stock_level in products
+                }
+            )
+        return updated_count
+
+    def update_unit_prices(self, unit_price=None, percent=None):
+        """
+        Sets every price to `unit_price` or changes it by `percent`, with
+        one UPDATE per chunk of PRICE_UPDATE_CHUNK_SIZE products.
+        """
+        if percent is not None:
+            new_price = Round(F("unit_price") * (100 + percent) / 100, 2)
+            queryset = self
+        else:
+            new_price = Value(unit_price)
+            queryset = self.exclude(unit_price=unit_price)
+        updated_count = 0
+        with transaction.atomic():
+            previous_prices = dict(
+                queryset.select_for_update()
+                .order_by("pk")
+                .values_list("pk", "unit_price")
+            )
+            product_ids = list(previous_prices)
+            now = timezone.now()
+            for i in range(0, len(product_ids), Product.PRICE_UPDATE_CHUNK_SIZE):
+                chunk = Product.objects.filter(
+                    pk__in=product_ids[i : i + Product.PRICE_UPDATE_CHUNK_SIZE]
+                )
+                updated_count += chunk.update(
+                    unit_price=new_price, datetime_modified=now
+                )
+                OutboxEvent.publish(
+                    OutboxEvent.TOPIC_PRODUCT_PRICE,
+                    [
+                        {
+                            "id": pk,
+                            "unit_price": price,
+                            "previous_unit_price": previous_prices[pk],
+                        }
+                        for pk, price in chunk.values_list("pk", "unit_price")
+                        if price != previous_prices[pk]
+                    ],
+                )
+            if product_ids:
+                # One invalidation however many products changed.
+                transaction.on_commit(lambda: cache.delete(Product.FACETS_CACHE_KEY))
+        return updated_count
+
+    def attach_discount(self, discount):
+        Through = Product.discounts.through
+        with transaction.atomic():
+            product_ids = list(
+                self.exclude(discounts=discount)
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            )
+            Through.objects.bulk_create(
+                [
+                    Through(product_id=product_id, discount_id=discount.pk)
+                    for product_id in product_ids
+                ],
+                batch_size=Product.PRICE_UPDATE_CHUNK_SIZE,
+                ignore_conflicts=True,
+            )
+            for i in range(0, len(product_ids), Product.PRICE_UPDATE_CHUNK_SIZE):
+                Product.objects.filter(
+                    pk__in=product_ids[i : i + Product.PRICE_UPDATE_CHUNK_SIZE]
+                ).update(datetime_modified=timezone.now())
+        return len(product_ids)
+
+    def update_stock_levels(self, changes):
+        """
+        Stores new stock levels given as {pk: (previous, new)} and shifts
+        the StockLevelCount summary by the products that changed level.
+        """
+        changes = {
+            pk: levels for pk, levels in changes.items() if levels[0] != levels[1]
+        }
+        if not changes:
+            return
+        Product.objects.filter(pk__in=changes).update(
+            stock_level=Case(
+                *[
+                    When(pk=pk, then=Value(new))
+                    for pk, (previous, new) in changes.items()
+                ],
+                output_field=models.CharField(),
+            ),
+            stock_level_changed_at=timezone.now(),
+        )
+        deltas = Counter()
+        for previous, new in changes.values():
+            deltas[previous] -= 1
+            deltas[new] += 1
+        StockLevelCount.shift(deltas)
+
+
+class Product(OutboxFieldsMixin, models.Model):
+    FACETS_CACHE_KEY = "store:product-facets"
+    STOCK_LEVEL_LOW = "l"
+    STOCK_LEVEL_MEDIUM = "m"
+    STOCK_LEVEL_HIGH = "h"
+    STOCK_LEVELS = [
+        (STOCK_LEVEL_LOW, "Low"),
+        (STOCK_LEVEL_MEDIUM, "Medium"),
+        (STOCK_LEVEL_HIGH, "High"),
+    ]
+    STOCK_LEVEL_LOW_MAX = 20
+    STOCK_LEVEL_HIGH_MIN = 50
+    MAX_UNIT_PRICE = Decimal("9999.99")
+    PRICE_UPDATE_CHUNK_SIZE = 2000
+
     name = models.CharField(max_length=255)
     category = models.ForeignKey(
         Category, on_delete=models.PROTECT, related_name="products"
@@ -36,10 +287,128 @@ class Product(models.Model):
     datetime_created = models.DateTimeField(auto_now_add=True)
     datetime_modified = models.DateTimeField(auto_now=True)
     discounts = models.ManyToManyField(Discount, blank=True)
+    stock_level = models.CharField(
+        max_length=1, choices=STOCK_LEVELS, default=STOCK_LEVEL_LOW, editable=False
+    )
+    stock_level_changed_at = models.DateTimeField(null=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+    outbox_fields = {
+        "inventory": OutboxEvent.TOPIC_PRODUCT_INVENTORY,
+        "unit_price": OutboxEvent.TOPIC_PRODUCT_PRICE,
+    }
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["datetime_created"]),
+            models.Index(fields=["inventory"]),
+            models.Index(fields=["unit_price"]),
+            models.Index(fields=["stock_level", "stock_level_changed_at"]),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def get_stock_level(cls, inventory):
+        if inventory <= cls.STOCK_LEVEL_LOW_MAX:
+            return cls.STOCK_LEVEL_LOW
+        if inventory >= cls.STOCK_LEVEL_HIGH_MIN:
+            return cls.STOCK_LEVEL_HIGH
+        return cls.STOCK_LEVEL_MEDIUM
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.stock_level = self.get_stock_level(self.inventory)
+            self.stock_level_changed_at = timezone.now()
+            with transaction.atomic(using=kwargs.get("using")):
+                super().save(*args, **kwargs)
+                StockLevelCount.shift({self.stock_level: 1})
+            return
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            update_fields = {
+                field.attname
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+            } - self.get_deferred_fields()
+        # The loaded inventory and stock level may be stale after a checkout
+        # or clear_inventory, so an unchanged inventory isn't written back and
+        # the stock level is only written from the row's current level.
+        update_fields = set(update_fields) - {"stock_level", "stock_level_changed_at"}
+        snapshot = getattr(self, "_outbox_snapshot", {})
+        inventory = self.__dict__.get("inventory")
+        if "inventory" in snapshot and snapshot["inventory"] == inventory:
+            update_fields.discard("inventory")
+        previous_level = level = None
+        with transaction.atomic(using=kwargs.get("using")):
+            if "inventory" in update_fields:
+                previous_level = (
+                    Product.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values_list("stock_level", flat=True)
+                    .first()
+                )
+                level = self.get_stock_level(self.inventory)
+                if level != previous_level:
+                    self.stock_level = level
+                    self.stock_level_changed_at = timezone.now()
+                    update_fields |= {"stock_level", "stock_level_changed_at"}
+            super().save(*args, **{**kwargs, "update_fields": update_fields})
+            if level != previous_level:
+                StockLevelCount.shift({previous_level: -1, level: 1})
+
+
+class StockLevelCount(models.Model):
+    """Number of products per stock level, kept up to date incrementally."""
+
+    stock_level = models.CharField(
+        max_length=1, choices=Product.STOCK_LEVELS, primary_key=True
+    )
+    products_count = models.IntegerField(default=0)
+
+    @classmethod
+    def shift(cls, deltas):
+        deltas = {level: delta for level, delta in deltas.items() if level and delta}
+        if not deltas:
+            return
+        cls.objects.filter(pk__in=deltas).update(
+            products_count=F("products_count")
+            + Case(
+                *[When(pk=level, then=Value(delta)) for level, delta in deltas.items()],
+                output_field=models.IntegerField(),
+            )
+        )
+
+    @classmethod
+    def rebuild(cls):
+        """Recomputes every stock level, e.g. after a bulk_create import."""
+        level_filters = {
+            Product.STOCK_LEVEL_LOW: Q(inventory__lte=Product.STOCK_LEVEL_LOW_MAX),
+            Product.STOCK_LEVEL_MEDIUM: Q(
+                inventory__gt=Product.STOCK_LEVEL_LOW_MAX,
+                inventory__lt=Product.STOCK_LEVEL_HIGH_MIN,
+            ),
+            Product.STOCK_LEVEL_HIGH: Q(inventory__gte=Product.STOCK_LEVEL_HIGH_MIN),
+        }
+        with transaction.atomic():
+            for level, level_filter in level_filters.items():
+                Product.objects.filter(level_filter).exclude(stock_level=level).update(
+                    stock_level=level, stock_level_changed_at=timezone.now()
+                )
+            counts = dict(
+                Product.objects.order_by()
+                .values("stock_level")
+                .annotate(products_count=Count("id"))
+                .values_list("stock_level", "products_count")
+            )
+            for level in level_filters:
+                cls.objects.update_or_create(
+                    stock_level=level,
+                    defaults={"products_count": counts.get(level, 0)},
+                )
+
 
 class Customer(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
@@ -62,6 +431,65 @@ class Customer(models.Model):
     def username(self):
         return self.user.username
 
+
+class CustomerSearchTerm(models.Model):
+    """
+    Normalized names, email and phone digits of a customer, so a search
+    is one prefix match on an indexed column instead of LIKEs over the
+    user and customer columns.
+    """
+
+    customer = models.ForeignKey(
+        Customer, on_delete=models.CASCADE, related_name="search_terms"
+    )
+    term = models.CharField(max_length=255, db_index=True)
+
+    @staticmethod
+    def get_terms(first_name, last_name, email, phone_number):
+        first_name, last_name = normalize(first_name), normalize(last_name)
+        terms = {
+            first_name,
+            last_name,
+            f"{first_name} {last_name}",
+            f"{last_name} {first_name}",
+            normalize(email),
+        }
+        # Phone digits as typed and without a leading trunk zero or
+        # country code, so "0912..." and "+98 912..." find each other.
+        digits = re.sub(r"\D", "", phone_number)
+        terms |= {digits, digits.lstrip("0"), digits[-10:]}
+        return {term.strip()[:255] for term in terms if term.strip()}
+
+    @classmethod
+    def index_customers(cls, customer_ids):
+        customer_ids = list(customer_ids)
+        customers = Customer.objects.filter(pk__in=customer_ids).values_list(
+            "pk", "user__first_name", "user__last_name", "user__email", "phone_number"
+        )
+        with transaction.atomic():
+            cls.objects.filter(customer_id__in=customer_ids).delete()
+            cls.objects.bulk_create(
+                cls(customer_id=pk, term=term)
+                for pk, *fields in customers
+                for term in cls.get_terms(*fields)
+            )
+
+    @classmethod
+    def search(cls, query):
+        """Ids of customers with a term starting with the query, as a subquery."""
+        prefixes = {normalize(query)}
+        digits = re.sub(r"\D", "", query)
+        if digits and not any(char.isalpha() for char in query):
+            prefixes |= {digits, digits.lstrip("0")}
+        # Terms and prefixes are already lowercase, and istartswith is the
+        # plain LIKE 'prefix%' that MySQL answers with a range scan of the
+        # term index under the column's default case-insensitive collation.
+        condition = Q(pk__in=[])
+        for prefix in prefixes - {""}:
+            condition |= Q(term__istartswith=prefix)
+        return cls.objects.filter(condition).values("customer_id")
+
+
 class Address(models.Model):
     customer = models.OneToOneField(
         Customer, on_delete=models.CASCADE, primary_key=True
@@ -71,12 +499,56 @@ class Address(models.Model):
     street = models.CharField(max_length=255)
 
 
+class OrderQuerySet(models.QuerySet):
+    def transition_status(self, status):
+        allowed_statuses = Order.ORDER_STATUS_TRANSITIONS[status]
+        with transaction.atomic():
+            previous_statuses = dict(
+                self.select_for_update().order_by("id").values_list("id", "status")
+            )
+            self.filter(status__in=allowed_statuses).update(status=status)
+            changed_ids = [
+                order_id
+                for order_id, previous_status in previous_statuses.items()
+                if previous_status in allowed_statuses
+            ]
+            OutboxEvent.publish(
+                OutboxEvent.TOPIC_ORDER_STATUS,
+                [
+                    {
+                        "id": order_id,
+                        "status": status,
+                        "previous_status": previous_statuses[order_id],
+                    }
+                    for order_id in changed_ids
+                ],
+            )
+            if status == Order.ORDER_STATUS_CANCELED:
+                Order.objects.filter(pk__in=changed_ids).release_inventory()
+            if changed_ids:
+                transaction.on_commit(
+                    lambda: order_status_changed.send(
+                        sender=Order, order_ids=changed_ids, status=status
+                    )
+                )
+        return previous_statuses, changed_ids
+
+    def release_inventory(self):
+        quantities = (
+            OrderItem.objects.filter(order__in=self)
+            .values("product_id")
+            .annotate(total_quantity=Sum("quantity"))
+            .values_list("product_id", "total_quantity")
+        )
+        return Product.objects.adjust_inventory(dict(quantities))
+
+
 class UnpaidOrderManger(models.Manager):
     def get_queryset(self):
         return super().get_queryset().filter(status=Order.ORDER_STATUS_UNPAID)
 
 
-class Order(models.Model):
+class Order(OutboxFieldsMixin, models.Model):
     ORDER_STATUS_PAID = "p"
     ORDER_STATUS_UNPAID = "u"
     ORDER_STATUS_CANCELED = "c"
@@ -85,6 +557,11 @@ class Order(models.Model):
         (ORDER_STATUS_UNPAID, "Unpaid"),
         (ORDER_STATUS_CANCELED, "Canceled"),
     ]
+    ORDER_STATUS_TRANSITIONS = {
+        ORDER_STATUS_PAID: [ORDER_STATUS_UNPAID],
+        ORDER_STATUS_UNPAID: [],
+        ORDER_STATUS_CANCELED: [ORDER_STATUS_UNPAID],
+    }
 
     customer = models.ForeignKey(
         Customer, on_delete=models.PROTECT, related_name="orders"
@@ -94,19 +571,43 @@ class Order(models.Model):
         max_length=1, choices=ORDER_STATUS, default=ORDER_STATUS_UNPAID
     )
 
-    objects = models.Manager()
+    objects = OrderQuerySet.as_manager()
     unpaid_orders = UnpaidOrderManger()
+    outbox_fields = {
+        "status": OutboxEvent.TOPIC_ORDER_STATUS,
+    }
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "datetime_created"]),
+            models.Index(fields=["datetime_created"]),
+        ]
 
     def __str__(self):
         return f"Order id={self.id}"
 
+    @classmethod
+    def get_transition_error(cls, previous_status, status):
+        """Why an order can't go from previous_status to status, or None."""
+        if previous_status in cls.ORDER_STATUS_TRANSITIONS[status]:
+            return None
+        labels = dict(cls.ORDER_STATUS)
+        return (
+            f"An order can't change from {labels[previous_status]} "
+            f"to {labels[status]}."
+        )
+
     
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.PROTECT, related_name="items")
     product = models.ForeignKey(
-        Product, on_delete=models.PROTECT, related_name="order_items"
+        Product, on_delete=models.SET_NULL, null=True, related_name="order_items"
     )
+    # Copied from the product at checkout so order history neither joins
+    # Product nor changes when the product is renamed or deleted.
+    product_name = models.CharField(max_length=255, blank=True)
+    product_slug = models.SlugField(blank=True)
     quantity = models.PositiveSmallIntegerField()
     unit_price = models.DecimalField(max_digits=6, decimal_places=2)
 
@@ -114,10 +615,110 @@ class OrderItem(models.Model):
         unique_together = [["order", "product"]]
 
 
+class ArchivedOrder(models.Model):
+    """Paid or canceled order moved out of Order by archive_orders."""
+
+    ARCHIVABLE_STATUSES = [Order.ORDER_STATUS_PAID, Order.ORDER_STATUS_CANCELED]
+
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(
+        Customer, on_delete=models.PROTECT, related_name="archived_orders"
+    )
+    datetime_created = models.DateTimeField()
+    status = models.CharField(max_length=1, choices=Order.ORDER_STATUS)
+    datetime_archived = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["datetime_created"]),
+        ]
+
+    def __str__(self):
+        return f"Archived order id={self.id}"
+
+    @staticmethod
+    def get_cutoff():
+        """Orders created before this may live in the archive."""
+        return timezone.now() - settings.ORDER_ARCHIVE_AFTER
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(
+        ArchivedOrder, on_delete=models.CASCADE, related_name="items"
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="archived_order_items",
+    )
+    product_name = models.CharField(max_length=255, blank=True)
+    product_slug = models.SlugField(blank=True)
+    quantity = models.PositiveSmallIntegerField()
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2)
+
+
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True, encoder=JSONEncoder)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = [["user", "key"]]
+
+
 class CommentManger(models.Manager):
     def get_approved(self):
         return self.get_queryset().filter(status=Comment.COMMENT_STATUS_APPROVED)
 
+    def get_moderatable(self, moderator):
+        return self.get_queryset().filter(
+            Q(moderator=moderator)
+            | Q(claimed_until__isnull=True)
+            | Q(claimed_until__lt=timezone.now()),
+            status=Comment.COMMENT_STATUS_WAITING,
+        )
+
+    def claim(self, moderator, count):
+        with transaction.atomic():
+            comment_ids = list(
+                self.get_moderatable(moderator)
+                .select_for_update(skip_locked=True)
+                .order_by("datetime_created", "id")
+                .values_list("id", flat=True)[:count]
+            )
+            self.get_queryset().filter(id__in=comment_ids).update(
+                moderator=moderator,
+                claimed_until=timezone.now() + settings.COMMENT_MODERATION_LEASE,
+            )
+        return (
+            self.get_queryset()
+            .filter(id__in=comment_ids)
+            .order_by("datetime_created", "id")
+        )
+
+    def moderate(self, moderator, approved_ids=(), rejected_ids=()):
+        return (
+            self.get_moderatable(moderator)
+            .filter(id__in=[*approved_ids, *rejected_ids])
+            .update(
+                status=Case(
+                    When(
+                        id__in=approved_ids, then=Value(Comment.COMMENT_STATUS_APPROVED)
+                    ),
+                    default=Value(Comment.COMMENT_STATUS_NOT_APPROVED),
+                ),
+                moderator=moderator,
+                claimed_until=None,
+            )
+        )
+
 
 class ApprovedCommentManager(models.Manager):
     def get_queryset(self):
@@ -143,14 +744,35 @@ class Comment(models.Model):
     status = models.CharField(
         max_length=2, choices=COMMENT_STATUS, default=COMMENT_STATUS_WAITING
     )
+    moderator = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    claimed_until = models.DateTimeField(null=True, blank=True)
 
     objects = CommentManger()
     approved = ApprovedCommentManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["product", "status", "datetime_created", "id"]),
+            models.Index(fields=["status", "datetime_created", "id"]),
+            models.Index(fields=["datetime_created"]),
+        ]
+
 
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4)
     created_at = models.DateTimeField(auto_now_add=True)
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"]),
+        ]
 
 
 class CartItem(models.Model):
@@ -162,3 +784,61 @@ class CartItem(models.Model):
 
     class Meta:
         unique_together = [["cart", "product"]]
+
+
+class PrivateEmail(models.Model):
+    ENQUEUE_CHUNK_SIZE = 1000
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    datetime_created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.subject
+
+    def enqueue(self, customers):
+        customer_ids = customers.order_by("pk").values_list("pk", flat=True)
+        queued_count = 0
+        last_pk = 0
+        while True:
+            chunk = list(customer_ids.filter(pk__gt=last_pk)[: self.ENQUEUE_CHUNK_SIZE])
+            if not chunk:
+                return queued_count
+            PrivateEmailJob.objects.bulk_create(
+                [PrivateEmailJob(email=self, customer_id=pk) for pk in chunk]
+            )
+            queued_count += len(chunk)
+            last_pk = chunk[-1]
+
+
+class PrivateEmailJob(models.Model):
+    JOB_STATUS_PENDING = "p"
+    JOB_STATUS_SENDING = "s"
+    JOB_STATUS_SENT = "d"
+    JOB_STATUS_FAILED = "f"
+    JOB_STATUS = [
+        (JOB_STATUS_PENDING, "Pending"),
+        (JOB_STATUS_SENDING, "Sending"),
+        (JOB_STATUS_SENT, "Sent"),
+        (JOB_STATUS_FAILED, "Failed"),
+    ]
+
+    email = models.ForeignKey(
+        PrivateEmail, on_delete=models.CASCADE, related_name="jobs"
+    )
+    customer = models.ForeignKey(
+        Customer, on_delete=models.CASCADE, related_name="private_email_jobs"
+    )
+    status = models.CharField(
+        max_length=1, choices=JOB_STATUS, default=JOB_STATUS_PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    datetime_created = models.DateTimeField(auto_now_add=True)
+    datetime_sent = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"]),
+        ]
@@ -0,0 +1,64 @@
+import json
+import os
+import urllib.request
+
+from django.utils.module_loading import import_string
+
+
+def encode_events(events):
+    return b"".join(
+        json.dumps(
+            {**event, "datetime_created": event["datetime_created"].isoformat()},
+            separators=(",", ":"),
+        ).encode()
+        + b"\n"
+        for event in events
+    )
+
+
+class FileSink:
+    """Appends each batch to an NDJSON file and fsyncs it."""
+
+    def __init__(self, path, **options):
+        self.file = open(path, "ab")
+
+    def send(self, events):
+        self.file.write(encode_events(events))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+class HTTPSink:
+    """POSTs each batch as an NDJSON body; any non-2xx response fails it."""
+
+    def __init__(self, url, timeout=10, **options):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, events):
+        request = urllib.request.Request(
+            self.url,
+            data=encode_events(events),
+            headers={"Content-Type": "application/x-ndjson"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def close(self):
+        pass
+
+
+SINKS = {
+    "file": FileSink,
+    "http": HTTPSink,
+}
+
+
+def get_sink(name, **options):
+    """Builds a sink by short name or by the dotted path of its class."""
+    sink_class = SINKS.get(name) or import_string(name)
+    return sink_class(**options)
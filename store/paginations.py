@@ -1,5 +1,73 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class DefaultPagination(PageNumberPagination):
-    page_size = 10 
\ No newline at end of file
+    page_size = 10
+
+
+class KnownCountPagination(DefaultPagination):
+    """
+    Reuses a row count the view already computed, set as `known_count`,
+    instead of running COUNT(*) again.
+    """
+
+    known_count = None
+
+    def django_paginator_class(self, object_list, per_page):
+        paginator = Paginator(object_list, per_page)
+        if self.known_count is not None:
+            paginator.count = self.known_count
+        return paginator
+
+
+class CommentCursorPagination(CursorPagination):
+    page_size = 20
+    ordering = ["-datetime_created", "-id"]
+
+
+class CommentModerationCursorPagination(CursorPagination):
+    page_size = 50
+    ordering = ["datetime_created", "id"]
+
+
+def get_estimated_row_count(model, using):
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == "mysql":
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [model._meta.db_table],
+            )
+        elif connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [model._meta.db_table],
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Takes the row count of unfiltered querysets on large tables from the
+    database's table statistics instead of running COUNT(*).
+    """
+
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is not None and not query.where:
+            estimate = get_estimated_row_count(
+                self.object_list.model, self.object_list.db
+            )
+            if estimate is not None and estimate > self.estimate_threshold:
+                return estimate
+        return super().count
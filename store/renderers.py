@@ -0,0 +1,43 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    A drop-in JSONRenderer that serializes with orjson when it is installed.
+
+    Types orjson does not handle itself (Decimal, dates and times, lazy
+    strings) are passed to DRF's JSONEncoder, so they come out as they do
+    from the stock renderer. Floats may differ in spelling only (orjson
+    writes 1e16 where json writes 1e+16). Indented output, which the
+    browsable API asks for, a missing orjson and data orjson rejects, such
+    as integers wider than 64 bits, fall back to the stock renderer.
+    """
+
+    default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        renderer_context = renderer_context or {}
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+            )
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer, so the output is safe inside <script>.
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
@@ -0,0 +1,123 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY_DB = "default"
+PIN_COOKIE = "primary_pin"
+PIN_HEADER = "X-Primary-Pin"
+
+_replica_reads_allowed = ContextVar("replica_reads_allowed", default=False)
+
+
+def get_replica_lag(alias):
+    """Returns the replication lag in seconds, or None if it is unknown."""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == "mysql":
+            cursor.execute("SHOW REPLICA STATUS")
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            columns = [column[0] for column in cursor.description]
+            return dict(zip(columns, row)).get("Seconds_Behind_Source")
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT COALESCE(EXTRACT(EPOCH FROM "
+                "now() - pg_last_xact_replay_timestamp()), 0)"
+            )
+            return cursor.fetchone()[0]
+    return 0
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends catalog reads made while serving safe-method requests to a
+    healthy replica; everything else goes to the primary.
+    """
+
+    replica_models = {
+        "store.product",
+        "store.category",
+        "store.discount",
+        "store.comment",
+    }
+
+    def __init__(self):
+        self.replica_health = {}
+
+    def db_for_read(self, model, **hints):
+        if (
+            not _replica_reads_allowed.get()
+            or model._meta.label_lower not in self.replica_models
+        ):
+            return PRIMARY_DB
+        replicas = [
+            alias for alias in settings.DATABASE_REPLICAS if self.is_healthy(alias)
+        ]
+        return random.choice(replicas) if replicas else PRIMARY_DB
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+    def is_healthy(self, alias):
+        checked_at, healthy = self.replica_health.get(alias, (None, False))
+        now = time.monotonic()
+        if (
+            checked_at is None
+            or now - checked_at >= settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL
+        ):
+            try:
+                lag = get_replica_lag(alias)
+            except DatabaseError:
+                lag = None
+            healthy = lag is not None and lag <= settings.DATABASE_REPLICA_MAX_LAG
+            self.replica_health[alias] = (now, healthy)
+        return healthy
+
+
+class ReplicaPinningMiddleware:
+    """
+    Allows replica reads for safe-method requests unless the client wrote
+    recently, and pins clients to the primary for a short window after a
+    successful write (cookie for browsers, header for API clients).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _replica_reads_allowed.set(
+            request.method in SAFE_METHODS and not self.is_pinned(request)
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica_reads_allowed.reset(token)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            pin_seconds = settings.DATABASE_REPLICA_PIN_SECONDS
+            pin_until = str(int(time.time() + pin_seconds))
+            response.set_cookie(
+                PIN_COOKIE, pin_until, max_age=pin_seconds, httponly=True
+            )
+            response[PIN_HEADER] = pin_until
+        return response
+
+    def is_pinned(self, request):
+        pin_until = request.headers.get(PIN_HEADER) or request.COOKIES.get(PIN_COOKIE)
+        try:
+            return pin_until is not None and float(pin_until) > time.time()
+        except ValueError:
+            return False
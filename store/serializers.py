@@ -1,13 +1,89 @@
 from decimal import Decimal
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from django.utils.text import slugify
 from django.db.models import F, Sum
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.template import Template, TemplateSyntaxError
 
 from . import models
 
 
+def get_sparse_fieldset(request, field_names):
+    selected = set(field_names)
+    fields = request.query_params.get("fields")
+    if fields:
+        selected &= {name.strip() for name in fields.split(",")}
+    omit = request.query_params.get("omit")
+    if omit:
+        selected -= {name.strip() for name in omit.split(",")}
+    return selected
+
+
+class SparseFieldsetMixin:
+    """
+    Drops the fields left out by ?fields= / ?omit= on safe requests.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        for field_name in set(self.fields) - get_sparse_fieldset(request, self.fields):
+            self.fields.pop(field_name)
+
+
+def get_expand_tree(request, max_depth):
+    tree = {}
+    for path in request.query_params.get("expand", "").split(","):
+        field_names = [name.strip() for name in path.split(".") if name.strip()]
+        if len(field_names) > max_depth:
+            raise serializers.ValidationError(
+                {"expand": [f"Expansions can be at most {max_depth} levels deep."]}
+            )
+        node = tree
+        for field_name in field_names:
+            node = node.setdefault(field_name, {})
+    return tree
+
+
+def get_expand_paths(tree, prefix=""):
+    for field_name, subtree in tree.items():
+        yield prefix + field_name
+        yield from get_expand_paths(subtree, f"{prefix}{field_name}.")
+
+
+class ExpandableFieldsMixin:
+    """
+    Replaces the fields named by ?expand= (dotted for nested serializers)
+    with the serializers listed in expandable_fields on safe requests.
+    """
+
+    max_expand_depth = 2
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        self.expand(get_expand_tree(request, self.max_expand_depth))
+
+    def expand(self, tree):
+        for field_name, subtree in tree.items():
+            if field_name not in self.fields:
+                continue
+            if field_name in self.expandable_fields:
+                serializer_class, serializer_kwargs = self.expandable_fields[field_name]
+                self.fields[field_name] = serializer_class(**serializer_kwargs)
+            field = self.fields[field_name]
+            field = getattr(field, "child", field)
+            if subtree and isinstance(field, ExpandableFieldsMixin):
+                field.expand(subtree)
+
+
 class CategorySerializer(serializers.ModelSerializer):
     num_of_product = serializers.IntegerField(read_only=True)
 
@@ -25,7 +101,9 @@ class CategorySerializer(serializers.ModelSerializer):
     #     return getattr(category, 'num_of_product', 0)
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(
+    ExpandableFieldsMixin, SparseFieldsetMixin, serializers.ModelSerializer
+):
     class Meta:
         model = models.Product
         fields = [
@@ -43,6 +121,9 @@ class ProductSerializer(serializers.ModelSerializer):
         queryset=models.Category.objects.all(),
         view_name="category-detail",
     )
+    expandable_fields = {
+        "category": (CategorySerializer, {"read_only": True}),
+    }
 
     def get_unit_price_after_tax(self, product: models.Product):
         return round(product.unit_price * Decimal(1.09), 2)
@@ -63,6 +144,57 @@ class ProductSerializer(serializers.ModelSerializer):
     #     return product
 
 
+class StockLevelProductSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.Product
+        fields = [
+            "id",
+            "name",
+            "inventory",
+            "stock_level",
+            "stock_level_changed_at",
+        ]
+
+
+class StockLevelCountSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.StockLevelCount
+        fields = [
+            "stock_level",
+            "products_count",
+        ]
+
+
+class LowStockQuerySerializer(serializers.Serializer):
+    since = serializers.DateTimeField()
+
+
+class ProductBulkPricingSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False
+    )
+    unit_price = serializers.DecimalField(
+        max_digits=6, decimal_places=2, min_value=0, required=False
+    )
+    percent = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=Decimal("-99.99"), required=False
+    )
+    discount = serializers.PrimaryKeyRelatedField(
+        queryset=models.Discount.objects.all(), required=False
+    )
+
+    def validate(self, data):
+        if "unit_price" in data and "percent" in data:
+            raise serializers.ValidationError(
+                "Provide either unit_price or percent, not both."
+            )
+        if not {"unit_price", "percent", "discount"} & set(data):
+            raise serializers.ValidationError(
+                "Provide unit_price, percent or discount."
+            )
+        return data
+
+
 class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Comment
@@ -78,6 +210,40 @@ class CommentSerializer(serializers.ModelSerializer):
         return models.Comment.objects.create(product_id=product_pk, **validated_data)
 
 
+class CommentModerationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.Comment
+        fields = [
+            "id",
+            "product",
+            "name",
+            "body",
+            "status",
+            "datetime_created",
+        ]
+        read_only_fields = [
+            "product",
+            "name",
+            "body",
+        ]
+
+
+class CommentClaimSerializer(serializers.Serializer):
+    count = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class CommentModerateSerializer(serializers.Serializer):
+    approve = serializers.ListField(child=serializers.IntegerField(), default=list)
+    reject = serializers.ListField(child=serializers.IntegerField(), default=list)
+
+    def validate(self, data):
+        if set(data["approve"]) & set(data["reject"]):
+            raise serializers.ValidationError(
+                "A comment can not be approved and rejected at the same time."
+            )
+        return data
+
+
 class CartProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Product
@@ -140,7 +306,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         return cart_item.quantity * cart_item.product.unit_price
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total_price_cart = serializers.SerializerMethodField()
 
@@ -161,7 +327,7 @@ class CartSerializer(serializers.ModelSerializer):
         )
 
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Customer
         fields = [
@@ -173,6 +339,24 @@ class CustomerSerializer(serializers.ModelSerializer):
         ]
 
 
+class PrivateEmailSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.PrivateEmail
+        fields = [
+            "id",
+            "subject",
+            "body",
+        ]
+
+    def validate(self, data):
+        for field in ["subject", "body"]:
+            try:
+                Template(data[field])
+            except TemplateSyntaxError as error:
+                raise serializers.ValidationError({field: str(error)})
+        return data
+
+
 class OrderCustomerSerializer(serializers.ModelSerializer):
     first_name = serializers.CharField(max_length=255, source="user.first_name")
     last_name = serializers.CharField(max_length=255, source="user.last_name")
@@ -190,18 +374,19 @@ class OrderCustomerSerializer(serializers.ModelSerializer):
         ]
 
 
-class OrderItemProductSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = models.Product
-        fields = [
-            "id",
-            "name",
-            "unit_price",
-        ]
+class OrderItemProductSerializer(serializers.Serializer):
+    """The product as it was at checkout, read from the order item itself."""
 
+    id = serializers.IntegerField(source="product_id", allow_null=True)
+    name = serializers.CharField(source="product_name")
+    slug = serializers.CharField(source="product_slug")
+    unit_price = serializers.DecimalField(max_digits=6, decimal_places=2)
 
-class OrderItemSerializer(serializers.ModelSerializer):
-    product = OrderItemProductSerializer
+
+class OrderItemSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        "product": (OrderItemProductSerializer, {"source": "*", "read_only": True}),
+    }
 
     class Meta:
         model = models.OrderItem
@@ -213,7 +398,9 @@ class OrderItemSerializer(serializers.ModelSerializer):
         ]
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(
+    ExpandableFieldsMixin, SparseFieldsetMixin, serializers.ModelSerializer
+):
     items = OrderItemSerializer(many=True)
 
     class Meta:
@@ -226,7 +413,9 @@ class OrderSerializer(serializers.ModelSerializer):
         ]
 
 
-class OrderForAdminSerializer(serializers.ModelSerializer):
+class OrderForAdminSerializer(
+    ExpandableFieldsMixin, SparseFieldsetMixin, serializers.ModelSerializer
+):
     items = OrderItemSerializer(many=True)
     customer = OrderCustomerSerializer()
 
@@ -248,51 +437,112 @@ class OrderUpdateSerializer(serializers.ModelSerializer):
             "status",
         ]
 
+    def update(self, instance, validated_data):
+        # Goes through transition_status so a cancel gives the stock back
+        # and transitions outside ORDER_STATUS_TRANSITIONS are refused.
+        status = validated_data.get("status", instance.status)
+        if status == instance.status:
+            return instance
+        previous_statuses, changed_ids = models.Order.objects.filter(
+            pk=instance.pk
+        ).transition_status(status)
+        if not changed_ids:
+            raise serializers.ValidationError(
+                {
+                    "status": [
+                        models.Order.get_transition_error(
+                            previous_statuses[instance.pk], status
+                        )
+                    ]
+                }
+            )
+        instance.refresh_from_db(fields=["status"])
+        return instance
 
-class OrderCreateSerializer(serializers.Serializer):
-    cart_id = serializers.UUIDField()
 
-    def validate_cart_id(self, cart_id):
-        try:
-            if (
-                models.Cart.objects.prefetch_related("items")
-                .get(id=cart_id)
-                .items.count()
-                == 0
-            ):
-                raise serializers.ValidationError(
-                    "Your cart is empty! Please add some product to it first."
-                )
-        except models.Cart.DoesNotExist:
-            raise serializers.ValidationError("There is no cart with this cart id!")
+class OrderStatusTransitionSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False
+    )
+    status = serializers.ChoiceField(choices=models.Order.ORDER_STATUS)
 
-        return cart_id
 
-    def save(self, **kwargs):
-        with transaction.atomic():
-            cart_id = self.validated_data["cart_id"]
-            user_id = self.context["user_id"]
-            customer = get_object_or_404(models.Customer, user_id=user_id)
+class OrderCreateSerializer(serializers.Serializer):
+    cart_id = serializers.UUIDField()
 
-            order = models.Order()
-            order.customer = customer
-            order.save()
+    def save(self, **kwargs):
+        cart_id = self.validated_data["cart_id"]
+        user_id = self.context["user_id"]
+        customer_id = get_object_or_404(
+            models.Customer.objects.values_list("id", flat=True), user_id=user_id
+        )
 
-            cart_items = models.CartItem.objects.select_related("product").filter(
-                cart_id=cart_id
+        # The number of statements stays the same no matter how many items
+        # the cart holds: one locked read, one inventory update, one insert
+        # per table and two deletes.
+        with transaction.atomic():
+            cart_items = list(
+                models.CartItem.objects.select_for_update()
+                .filter(cart_id=cart_id)
+                .order_by("id")
+                .values_list(
+                    "product_id",
+                    "quantity",
+                    "product__unit_price",
+                    "product__inventory",
+                    "product__name",
+                    "product__slug",
+                )
             )
-
-            order_items = [
-                models.OrderItem(
-                    order=order,
-                    product=cart_item.product,
-                    unit_price=cart_item.product.unit_price,
-                    quantity=cart_item.quantity,
+            if not cart_items:
+                if models.Cart.objects.filter(id=cart_id).exists():
+                    raise serializers.ValidationError(
+                        {
+                            "cart_id": [
+                                "Your cart is empty! Please add some product to it first."
+                            ]
+                        }
+                    )
+                raise serializers.ValidationError(
+                    {"cart_id": ["There is no cart with this cart id!"]}
                 )
-                for cart_item in cart_items
+
+            out_of_stock = [
+                product_id
+                for product_id, quantity, unit_price, inventory, *_ in cart_items
+                if quantity > inventory
             ]
+            if out_of_stock:
+                raise serializers.ValidationError(
+                    {
+                        "cart_id": [
+                            f"There is not enough inventory for products {out_of_stock}."
+                        ]
+                    }
+                )
+            models.Product.objects.adjust_inventory(
+                {product_id: -quantity for product_id, quantity, *_ in cart_items}
+            )
+
+            order = models.Order.objects.create(customer_id=customer_id)
+
+            models.OrderItem.objects.bulk_create(
+                [
+                    models.OrderItem(
+                        order=order,
+                        product_id=product_id,
+                        product_name=name,
+                        product_slug=slug,
+                        unit_price=unit_price,
+                        quantity=quantity,
+                    )
+                    for product_id, quantity, unit_price, inventory, name, slug in cart_items
+                ]
+            )
 
-            models.OrderItem.objects.bulk_create(order_items)
-            models.Cart.objects.get(pk=cart_id).delete()
+            cart_items_queryset = models.CartItem.objects.filter(cart_id=cart_id)
+            cart_items_queryset._raw_delete(cart_items_queryset.db)
+            cart_queryset = models.Cart.objects.filter(id=cart_id)
+            cart_queryset._raw_delete(cart_queryset.db)
 
             return order
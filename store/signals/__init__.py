@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+
+# Sent once per bulk status transition with the ids of every changed order.
+order_status_changed = Signal()
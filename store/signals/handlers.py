@@ -1,9 +1,11 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.core.cache import cache
 from django.dispatch import receiver
 from django.conf import settings
 from django.utils.text import slugify
 
-from .. import models
+from .. import autocomplete, models
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
@@ -12,13 +14,92 @@ def create_customer_profile_for_newly_created_user(sender, instance, created, **
         models.Customer.objects.create(user=instance)
 
 
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def index_user_search_terms(sender, instance, created, update_fields=None, **kwargs):
+    # A new user's customer profile indexes itself when it is created.
+    if created or (
+        update_fields is not None
+        and not {"first_name", "last_name", "email"} & set(update_fields)
+    ):
+        return
+    models.CustomerSearchTerm.index_customers(
+        models.Customer.objects.filter(user_id=instance.pk).values_list("pk", flat=True)
+    )
+
+
+@receiver(post_save, sender=models.Customer)
+def index_customer_search_terms(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or "phone_number" in update_fields:
+        models.CustomerSearchTerm.index_customers([instance.pk])
+
+
+@receiver(pre_save, sender=models.Product)
+def note_product_name_change(
+    sender, instance: models.Product, update_fields=None, **kwargs
+):
+    instance._name_changed = instance._state.adding or (
+        (update_fields is None or "name" in update_fields)
+        and not models.Product.objects.filter(
+            pk=instance.pk, name=instance.name
+        ).exists()
+    )
+
+
 @receiver(pre_save, sender=models.Product)
 def generate_slug_product(sender, instance: models.Product, **kwargs):
-        base_slug = slugify(instance.name)
-        unique_slug = base_slug
-        counter = 1
-
-        while models.Product.objects.filter(slug=unique_slug).exists():
-            unique_slug = f"{base_slug}-{counter}"
-            counter += 1
-        instance.slug = unique_slug
+    # Runs after note_product_name_change; price and inventory edits keep
+    # the slug, and the product's own row never counts as taken.
+    if instance.slug and not instance._name_changed:
+        return
+    base_slug = slugify(instance.name)
+    unique_slug = base_slug
+    counter = 1
+
+    while (
+        models.Product.objects.filter(slug=unique_slug).exclude(pk=instance.pk).exists()
+    ):
+        unique_slug = f"{base_slug}-{counter}"
+        counter += 1
+    instance.slug = unique_slug
+
+
+@receiver(pre_save, sender=models.OrderItem)
+def snapshot_order_item_product(sender, instance: models.OrderItem, **kwargs):
+    # Checkout fills the snapshot itself; this covers items added elsewhere.
+    if instance.product_id is not None and not instance.product_name:
+        instance.product_name = instance.product.name
+        instance.product_slug = instance.product.slug
+
+
+@receiver(post_save, sender=models.CartItem)
+@receiver(post_delete, sender=models.CartItem)
+def increase_cart_version(sender, instance: models.CartItem, **kwargs):
+    models.Cart.objects.filter(pk=instance.cart_id).update(version=F("version") + 1)
+
+
+@receiver(post_save, sender=models.Product)
+@receiver(post_delete, sender=models.Product)
+@receiver(post_save, sender=models.Category)
+@receiver(post_delete, sender=models.Category)
+def clear_product_facets_cache(sender, instance, **kwargs):
+    cache.delete(models.Product.FACETS_CACHE_KEY)
+
+
+@receiver(post_save, sender=models.Product)
+def invalidate_product_autocomplete(sender, instance: models.Product, **kwargs):
+    # Price and inventory edits leave the names alone, so every worker
+    # keeps its index instead of rebuilding it.
+    if getattr(instance, "_name_changed", True):
+        autocomplete.invalidate()
+
+
+@receiver(post_delete, sender=models.Product)
+def invalidate_product_autocomplete_on_delete(
+    sender, instance: models.Product, **kwargs
+):
+    autocomplete.invalidate()
+
+
+@receiver(post_delete, sender=models.Product)
+def decrease_stock_level_count(sender, instance: models.Product, **kwargs):
+    models.StockLevelCount.shift({instance.stock_level: -1})
@@ -1,3 +1,1275 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from urllib.error import URLError
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, transaction
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import autocomplete, models, routers, throttling
+from .renderers import ORJSONRenderer
+
+
+class RefusingEmailBackend(BaseEmailBackend):
+    def open(self):
+        raise ConnectionRefusedError("Connection refused")
+
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError("Connection refused")
+
+
+def create_customer(username="customer", **kwargs):
+    user = get_user_model().objects.create_user(
+        username=username, email=f"{username}@example.com", password="secret", **kwargs
+    )
+    return user.customer
+
+
+def create_products(count, inventory=10, unit_price=5):
+    category = models.Category.objects.create(title="Category")
+    return models.Product.objects.bulk_create(
+        [
+            models.Product(
+                name=f"Product {i}",
+                slug=f"product-{i}",
+                description="",
+                unit_price=unit_price,
+                inventory=inventory,
+                category=category,
+            )
+            for i in range(count)
+        ]
+    )
+
+
+def create_cart(products, quantity=1):
+    cart = models.Cart.objects.create()
+    models.CartItem.objects.bulk_create(
+        [
+            models.CartItem(cart=cart, product=product, quantity=quantity)
+            for product in products
+        ]
+    )
+    return cart
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        # Token buckets live in process memory and the cache, and would
+        # carry over.
+        throttling._buckets.clear()
+        cache.clear()
+        self.customer = create_customer()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer.user)
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class SendPrivateEmailsTests(TransactionTestCase):
+    def setUp(self):
+        self.email = models.PrivateEmail.objects.create(
+            subject="Hello {{ user.username }}", body="Hi"
+        )
+        for username in ["ali", "sara"]:
+            create_customer(username)
+        self.email.enqueue(models.Customer.objects.all())
+
+    def send(self, **options):
+        call_command("send_private_emails", workers=1, stdout=StringIO(), **options)
+
+    def job_states(self):
+        return list(
+            models.PrivateEmailJob.objects.order_by("id").values_list(
+                "status", "attempts"
+            )
+        )
+
+    def test_sends_queued_jobs(self):
+        self.send()
+
+        self.assertEqual(self.job_states(), [("d", 1), ("d", 1)])
+        self.assertEqual(
+            sorted(message.subject for message in mail.outbox),
+            ["Hello ali", "Hello sara"],
+        )
+
+    @override_settings(EMAIL_BACKEND="store.tests.RefusingEmailBackend")
+    def test_refused_connection_requeues_jobs_until_attempts_run_out(self):
+        self.send(max_attempts=2)
+        self.assertEqual(self.job_states(), [("p", 1), ("p", 1)])
+
+        self.send(max_attempts=2)
+        self.assertEqual(self.job_states(), [("f", 2), ("f", 2)])
+        self.assertEqual(
+            set(models.PrivateEmailJob.objects.values_list("error", flat=True)),
+            {"Connection refused"},
+        )
+
+    def test_jobs_of_a_dead_worker_are_claimed_again_after_the_lease(self):
+        models.PrivateEmailJob.objects.update(
+            status=models.PrivateEmailJob.JOB_STATUS_SENDING,
+            attempts=1,
+            claimed_until=timezone.now() + timedelta(minutes=1),
+        )
+        self.send()
+        self.assertEqual(self.job_states(), [("s", 1), ("s", 1)])
+
+        models.PrivateEmailJob.objects.update(
+            claimed_until=timezone.now() - timedelta(seconds=1)
+        )
+        self.send()
+        self.assertEqual(self.job_states(), [("d", 2), ("d", 2)])
+
+    def test_expired_jobs_without_attempts_left_fail(self):
+        models.PrivateEmailJob.objects.update(
+            status=models.PrivateEmailJob.JOB_STATUS_SENDING,
+            attempts=3,
+            claimed_until=timezone.now() - timedelta(seconds=1),
+        )
+        self.send(max_attempts=3)
+
+        self.assertEqual(self.job_states(), [("f", 3), ("f", 3)])
+        self.assertEqual(mail.outbox, [])
+
+
+class CheckoutTests(APITestCase):
+    def checkout(self, cart, **headers):
+        return self.client.post(
+            "/store/orders/", {"cart_id": str(cart.id)}, format="json", **headers
+        )
+
+    def test_checkout_runs_the_same_queries_for_any_number_of_items(self):
+        for items_count in [1, 20, 100]:
+            with self.subTest(items_count=items_count):
+                cart = create_cart(create_products(items_count))
+                with self.assertNumQueries(17):
+                    response = self.checkout(cart)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data["items"]), items_count)
+
+    def test_checkout_with_idempotency_key_runs_the_same_queries(self):
+        for items_count in [1, 20, 100]:
+            with self.subTest(items_count=items_count):
+                cart = create_cart(create_products(items_count))
+                with self.assertNumQueries(23):
+                    response = self.checkout(
+                        cart, HTTP_IDEMPOTENCY_KEY=f"checkout-{items_count}"
+                    )
+                self.assertEqual(response.status_code, 200)
+
+    def test_checkout_holds_inventory_and_empties_the_cart(self):
+        products = create_products(2, inventory=10)
+        cart = create_cart(products, quantity=3)
+
+        self.checkout(cart)
+
+        self.assertEqual(
+            list(
+                models.Product.objects.order_by("id").values_list(
+                    "inventory", flat=True
+                )
+            ),
+            [7, 7],
+        )
+        self.assertFalse(models.Cart.objects.filter(pk=cart.pk).exists())
+
+
+class IdempotencyKeyTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = create_products(2, inventory=10)
+
+    def checkout(self, cart_id, key="checkout"):
+        return self.client.post(
+            "/store/orders/",
+            {"cart_id": str(cart_id)},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_the_original_response(self):
+        cart = create_cart(self.products)
+        response = self.checkout(cart.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(models.Cart.objects.filter(pk=cart.pk).exists())
+
+        retry = self.checkout(cart.id)
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), response.json())
+        self.assertEqual(models.Order.objects.count(), 1)
+
+    def test_reusing_a_key_with_another_body_is_rejected(self):
+        self.checkout(create_cart(self.products[:1]).id)
+
+        response = self.checkout(create_cart(self.products[1:]).id)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(models.Order.objects.count(), 1)
+
+    def test_failed_checkout_does_not_store_the_key(self):
+        response = self.checkout("00000000-0000-0000-0000-000000000000")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(models.IdempotencyKey.objects.exists())
+
+        response = self.checkout(create_cart(self.products).id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(models.Order.objects.count(), 1)
+
+    def test_expired_key_can_be_reused(self):
+        self.checkout(create_cart(self.products[:1]).id)
+        models.IdempotencyKey.objects.update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        response = self.checkout(create_cart(self.products[1:]).id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(models.Order.objects.count(), 2)
+        self.assertGreater(
+            models.IdempotencyKey.objects.get().expires_at, timezone.now()
+        )
+
+
+class OrderStatusTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer.user.is_staff = True
+        self.customer.user.is_superuser = True
+        self.customer.user.save()
+        self.product = create_products(1, inventory=10)[0]
+        response = self.client.post(
+            "/store/orders/",
+            {"cart_id": str(create_cart([self.product], quantity=3).id)},
+            format="json",
+        )
+        self.order = models.Order.objects.get(pk=response.data["id"])
+
+    def assertInventory(self, inventory):
+        self.product.refresh_from_db(fields=["inventory"])
+        self.assertEqual(self.product.inventory, inventory)
+
+    def patch_status(self, status):
+        return self.client.patch(
+            f"/store/orders/{self.order.pk}/", {"status": status}, format="json"
+        )
+
+    def test_cancel_via_patch_releases_inventory(self):
+        self.assertInventory(7)
+
+        response = self.patch_status(models.Order.ORDER_STATUS_CANCELED)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["status"], models.Order.ORDER_STATUS_CANCELED)
+        self.assertInventory(10)
+
+    def test_cancel_unpaid_cancel_releases_inventory_once(self):
+        self.patch_status(models.Order.ORDER_STATUS_CANCELED)
+
+        response = self.patch_status(models.Order.ORDER_STATUS_UNPAID)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("status", response.data)
+
+        response = self.client.post(
+            "/store/orders/transition/",
+            {"ids": [self.order.pk], "status": models.Order.ORDER_STATUS_CANCELED},
+            format="json",
+        )
+        self.assertEqual(response.data["changed"], 0)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, models.Order.ORDER_STATUS_CANCELED)
+        self.assertInventory(10)
+
+    def test_admin_list_editable_cancel_releases_inventory(self):
+        self.client.force_login(self.customer.user)
+        response = self.client.post(
+            "/admin/store/order/",
+            {
+                "form-TOTAL_FORMS": "1",
+                "form-INITIAL_FORMS": "1",
+                "form-0-id": str(self.order.pk),
+                "form-0-status": models.Order.ORDER_STATUS_CANCELED,
+                "_save": "Save",
+            },
+        )
+
+        self.assertEqual(response.status_code, 302)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, models.Order.ORDER_STATUS_CANCELED)
+        self.assertInventory(10)
+
+    def test_admin_change_form_rejects_invalid_transition(self):
+        models.Order.objects.filter(pk=self.order.pk).transition_status(
+            models.Order.ORDER_STATUS_PAID
+        )
+        item = self.order.items.get()
+        self.client.force_login(self.customer.user)
+        response = self.client.post(
+            f"/admin/store/order/{self.order.pk}/change/",
+            {
+                "customer": str(self.customer.pk),
+                "status": models.Order.ORDER_STATUS_UNPAID,
+                "items-TOTAL_FORMS": "1",
+                "items-INITIAL_FORMS": "1",
+                "items-MIN_NUM_FORMS": "1",
+                "items-MAX_NUM_FORMS": "20",
+                "items-0-id": str(item.pk),
+                "items-0-order": str(self.order.pk),
+                "items-0-product": str(self.product.pk),
+                "items-0-quantity": "3",
+                "items-0-unit_price": "5",
+            },
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "change from Paid to Unpaid")
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, models.Order.ORDER_STATUS_PAID)
+
+
+class OrderItemSnapshotTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = models.Product.objects.create(
+            name="Blue Shirt",
+            description="",
+            unit_price=5,
+            inventory=10,
+            category=models.Category.objects.create(title="Category"),
+        )
+        response = self.client.post(
+            "/store/orders/",
+            {"cart_id": str(create_cart([self.product]).id)},
+            format="json",
+        )
+        self.order_id = response.data["id"]
+
+    def get_item_product(self):
+        response = self.client.get(
+            f"/store/orders/{self.order_id}/", {"expand": "items.product"}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data["items"][0]["product"]
+
+    def test_deleting_the_product_keeps_order_history(self):
+        self.product.delete()
+
+        self.assertEqual(
+            self.get_item_product(),
+            {"id": None, "name": "Blue Shirt", "slug": "blue-shirt", "unit_price": 5},
+        )
+
+    def test_renaming_the_product_keeps_order_history(self):
+        self.product.name = "Red Hat"
+        self.product.save()
+
+        product = self.get_item_product()
+        self.assertEqual(
+            (product["id"], product["name"], product["slug"]),
+            (self.product.pk, "Blue Shirt", "blue-shirt"),
+        )
+
+    def test_backfill_fills_items_without_a_snapshot(self):
+        order = models.Order.objects.get(pk=self.order_id)
+        archived_order = models.ArchivedOrder.objects.create(
+            id=order.pk + 1000,
+            customer=self.customer,
+            datetime_created=timezone.now(),
+            status=models.Order.ORDER_STATUS_PAID,
+        )
+        models.ArchivedOrderItem.objects.create(
+            id=1000,
+            order=archived_order,
+            product=self.product,
+            quantity=1,
+            unit_price=5,
+        )
+        models.OrderItem.objects.update(product_name="", product_slug="")
+
+        call_command("backfill_order_item_snapshots", stdout=StringIO())
+
+        for model in [models.OrderItem, models.ArchivedOrderItem]:
+            with self.subTest(model=model.__name__):
+                self.assertEqual(
+                    list(model.objects.values_list("product_name", "product_slug")),
+                    [("Blue Shirt", "blue-shirt")],
+                )
+
+
+class CommentModerationTests(TestCase):
+    def setUp(self):
+        product = create_products(1)[0]
+        self.comments = models.Comment.objects.bulk_create(
+            [
+                models.Comment(product=product, name="Reader", body=f"Comment {i}")
+                for i in range(4)
+            ]
+        )
+        self.first = create_customer("first", is_staff=True).user
+        self.second = create_customer("second", is_staff=True).user
+
+    def claim(self, moderator, count=2):
+        return [
+            comment.pk for comment in models.Comment.objects.claim(moderator, count)
+        ]
+
+    def test_moderators_never_claim_the_same_comments(self):
+        first_ids = self.claim(self.first)
+        second_ids = self.claim(self.second)
+
+        self.assertEqual(first_ids, [comment.pk for comment in self.comments[:2]])
+        self.assertEqual(second_ids, [comment.pk for comment in self.comments[2:]])
+        self.assertEqual(self.claim(self.second), second_ids)
+
+    def test_expired_claims_can_be_claimed_again(self):
+        first_ids = self.claim(self.first, count=4)
+        self.assertEqual(self.claim(self.second), [])
+
+        models.Comment.objects.update(
+            claimed_until=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertEqual(self.claim(self.second), first_ids[:2])
+
+    def test_moderate_skips_comments_claimed_by_someone_else(self):
+        first_ids = self.claim(self.first)
+        second_ids = self.claim(self.second)
+
+        moderated_count = models.Comment.objects.moderate(
+            self.first, approved_ids=[first_ids[0], *second_ids]
+        )
+
+        self.assertEqual(moderated_count, 1)
+        self.assertEqual(
+            dict(models.Comment.objects.values_list("pk", "status")),
+            {
+                first_ids[0]: models.Comment.COMMENT_STATUS_APPROVED,
+                first_ids[1]: models.Comment.COMMENT_STATUS_WAITING,
+                **{pk: models.Comment.COMMENT_STATUS_WAITING for pk in second_ids},
+            },
+        )
+
+
+class StockLevelTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer.user.is_staff = True
+        self.customer.user.save()
+        self.product = models.Product.objects.create(
+            name="Blue Shirt",
+            description="",
+            unit_price=5,
+            inventory=100,
+            category=models.Category.objects.create(title="Category"),
+        )
+
+    def assertStockLevel(self, inventory, stock_level):
+        self.assertEqual(
+            models.Product.objects.values_list("inventory", "stock_level").get(
+                pk=self.product.pk
+            ),
+            (inventory, stock_level),
+        )
+        self.assertEqual(
+            dict(models.StockLevelCount.objects.values_list("pk", "products_count")),
+            {
+                level: int(level == stock_level)
+                for level, label in models.Product.STOCK_LEVELS
+            },
+        )
+
+    def test_checkout_moves_the_product_to_its_new_level(self):
+        self.client.post(
+            "/store/orders/",
+            {"cart_id": str(create_cart([self.product], quantity=60).id)},
+            format="json",
+        )
+
+        self.assertStockLevel(40, models.Product.STOCK_LEVEL_MEDIUM)
+
+    def test_clear_inventory_moves_products_to_low(self):
+        models.Product.objects.filter(pk=self.product.pk).clear_inventory()
+
+        self.assertStockLevel(0, models.Product.STOCK_LEVEL_LOW)
+
+    def test_saving_a_stale_instance_keeps_the_checkout(self):
+        product = models.Product.objects.get(pk=self.product.pk)
+        models.Product.objects.adjust_inventory({self.product.pk: -95})
+
+        product.name = "Renamed shirt"
+        product.save()
+
+        self.assertStockLevel(5, models.Product.STOCK_LEVEL_LOW)
+        self.assertEqual(
+            models.Product.objects.get(pk=self.product.pk).name, "Renamed shirt"
+        )
+
+    def test_new_inventory_moves_from_the_current_level(self):
+        product = models.Product.objects.get(pk=self.product.pk)
+        models.Product.objects.adjust_inventory({self.product.pk: -95})
+
+        product.inventory = 30
+        product.save()
+
+        self.assertStockLevel(30, models.Product.STOCK_LEVEL_MEDIUM)
+
+    def test_low_stock_lists_products_that_crossed_into_low(self):
+        since = timezone.now()
+        models.Product.objects.create(
+            name="Red Hat",
+            description="",
+            unit_price=5,
+            inventory=0,
+            category=self.product.category,
+        )
+        models.Product.objects.filter(pk=self.product.pk).clear_inventory()
+        before_since = models.Product.objects.create(
+            name="Green Scarf",
+            description="",
+            unit_price=5,
+            inventory=0,
+            category=self.product.category,
+        )
+        models.Product.objects.filter(pk=before_since.pk).update(
+            stock_level_changed_at=since - timedelta(days=1)
+        )
+
+        response = self.client.get(
+            "/store/products/low-stock/", {"since": since.isoformat()}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [product["name"] for product in response.data["results"]],
+            ["Red Hat", "Blue Shirt"],
+        )
+
+
+class ProductListConditionalGetTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = create_products(15)
+
+    def test_list_counts_products_once(self):
+        # One aggregate for the validators and the count, then the page.
+        with self.assertNumQueries(2):
+            response = self.client.get("/store/products/")
+        self.assertEqual(response.data["count"], 15)
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_list_has_etag_but_no_last_modified(self):
+        response = self.client.get("/store/products/")
+
+        self.assertIn("ETag", response.headers)
+        self.assertNotIn("Last-Modified", response.headers)
+        response = self.client.get(
+            "/store/products/", HTTP_IF_NONE_MATCH=response.headers["ETag"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_changes_after_a_delete(self):
+        response = self.client.get("/store/products/")
+        etag = response.headers["ETag"]
+        self.products[0].delete()
+
+        for headers in [
+            {"HTTP_IF_NONE_MATCH": etag},
+            {"HTTP_IF_MODIFIED_SINCE": "Fri, 01 Jan 2100 00:00:00 GMT"},
+        ]:
+            with self.subTest(headers=headers):
+                response = self.client.get("/store/products/", **headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data["count"], 14)
+
+    def test_faceted_list_changes_after_a_category_rename(self):
+        response = self.client.get("/store/products/?facets=true")
+        etag = response.headers["ETag"]
+        category = self.products[0].category
+        category.title = "Renamed"
+        category.save()
+
+        response = self.client.get(
+            "/store/products/?facets=true", HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["facets"]["categories"][0]["title"], "Renamed")
+
+
+class SparseFieldsetQueryTests(APITestCase):
+    def create_orders(self, count):
+        products = create_products(3)
+        orders = models.Order.objects.bulk_create(
+            [models.Order(customer=self.customer) for _ in range(count)]
+        )
+        models.OrderItem.objects.bulk_create(
+            [
+                models.OrderItem(
+                    order=order,
+                    product=product,
+                    product_name=product.name,
+                    product_slug=product.slug,
+                    quantity=1,
+                    unit_price=product.unit_price,
+                )
+                for order in orders
+                for product in products
+            ]
+        )
+
+    def assertQueriesPerPage(self, create_rows, queries):
+        # One row, then a page full of rows.
+        for rows_count in [1, 11]:
+            create_rows(rows_count)
+            for url, num in queries.items():
+                with self.subTest(url=url, rows_count=rows_count):
+                    with self.assertNumQueries(num):
+                        response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_product_pages(self):
+        # The aggregate for the validators and the count, then the page.
+        self.assertQueriesPerPage(
+            create_products,
+            {
+                "/store/products/": 2,
+                "/store/products/?expand=category": 2,
+                "/store/products/?fields=id,name": 2,
+                "/store/products/?omit=category,description": 2,
+                "/store/products/?fields=id,category&expand=category": 2,
+            },
+        )
+
+    def test_order_pages(self):
+        # The orders, then one prefetch of their items.
+        self.assertQueriesPerPage(
+            self.create_orders,
+            {
+                "/store/orders/": 2,
+                "/store/orders/?expand=items.product": 2,
+                "/store/orders/?fields=id,items&expand=items.product": 2,
+                "/store/orders/?fields=id,status": 1,
+                "/store/orders/?omit=items": 1,
+            },
+        )
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    def render(self, renderer_class, data):
+        return renderer_class().render(data, "application/json")
+
+    def test_renders_the_same_values_as_the_stock_renderer(self):
+        data = {
+            "price": Decimal("12.50"),
+            "created": timezone.now(),
+            "text": "line\u2028separator",
+            "ratio": 0.1,
+        }
+        self.assertEqual(
+            self.render(ORJSONRenderer, data), self.render(JSONRenderer, data)
+        )
+
+    def test_falls_back_to_the_stock_renderer_for_wide_integers(self):
+        data = {"id": 2**70}
+        self.assertEqual(
+            self.render(ORJSONRenderer, data), self.render(JSONRenderer, data)
+        )
+
+
+@override_settings(
+    REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_RATES": {
+            **settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"],
+            "carts": "3/min",
+        },
+    }
+)
+class TokenBucketThrottleTests(APITestCase):
+    def test_requests_past_the_burst_are_throttled(self):
+        for _ in range(3):
+            self.assertEqual(self.client.post("/store/carts/").status_code, 201)
+
+        response = self.client.post("/store/carts/")
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "20")
+
+    def test_write_scopes_skip_reads_and_keep_separate_buckets(self):
+        cart_ids = [self.client.post("/store/carts/").data["id"] for _ in range(3)]
+
+        for cart_id in cart_ids:
+            response = self.client.get(f"/store/carts/{cart_id}/")
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post("/store/orders/", {"cart_id": cart_ids[0]})
+        self.assertNotEqual(response.status_code, 429)
+        self.assertEqual(self.client.post("/store/carts/").status_code, 429)
+
+    @override_settings(THROTTLE_SYNC_BATCH=1)
+    def test_sync_merges_other_processes_requests(self):
+        now = 1_000_000.0
+        local = throttling.TokenBucket("throttle:test:sync", 1, 3)
+        other = throttling.TokenBucket("throttle:test:sync", 1, 3)
+        for _ in range(3):
+            self.assertEqual(other.consume(now), 0)
+
+        # The first request is admitted locally, and its sync brings in the
+        # other process's three.
+        self.assertEqual(local.consume(now), 0)
+        self.assertEqual(local.consume(now), 2)
+
+
+class ProductNameIndexTests(SimpleTestCase):
+    def test_longer_queries_rank_over_every_match(self):
+        index = autocomplete.ProductNameIndex(
+            (i, f"shirt {i:05d}", i) for i in range(5000)
+        )
+
+        for query in ["shi", "shirt", "shirt 0"]:
+            with self.subTest(query=query):
+                self.assertEqual(
+                    [product["id"] for product in index.search(query, 3)],
+                    [4999, 4998, 4997],
+                )
+
+    def test_matches_word_starts(self):
+        index = autocomplete.ProductNameIndex(
+            [(1, "Blue Shirt", 5), (2, "Shirtless Café", 9), (3, "Red Hat", 7)]
+        )
+
+        self.assertEqual([product["id"] for product in index.search("SHIRT")], [2, 1])
+        self.assertEqual([product["id"] for product in index.search("cafe")], [2])
+
+
+class ProductAutocompleteInvalidationTests(TestCase):
+    def setUp(self):
+        self.product = create_products(1)[0]
+        cache.delete(autocomplete.VERSION_CACHE_KEY)
+
+    def test_price_and_inventory_edits_keep_the_index(self):
+        self.product.unit_price = 20
+        self.product.inventory = 3
+        self.product.save()
+
+        self.assertIsNone(cache.get(autocomplete.VERSION_CACHE_KEY))
+
+    def test_renames_rebuild_the_index(self):
+        self.product.name = "Renamed"
+        self.product.save()
+
+        self.assertIsNotNone(cache.get(autocomplete.VERSION_CACHE_KEY))
+
+
+class ProductAutocompleteTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        create_products(30)
+        autocomplete.invalidate()
+
+    def test_limit_is_clamped(self):
+        for limit, results_count in [
+            ("-3", 1),
+            ("0", 1),
+            ("5", 5),
+            ("500", autocomplete.MAX_RESULTS),
+        ]:
+            with self.subTest(limit=limit):
+                response = self.client.get(
+                    "/store/products/autocomplete/", {"q": "prod", "limit": limit}
+                )
+                self.assertEqual(len(response.data), results_count)
+
+
+class FailingSecondBatchSink:
+    batches = []
+
+    def __init__(self, **options):
+        pass
+
+    def send(self, events):
+        if self.batches:
+            raise OSError("Sink is down")
+        self.batches.append(events)
+
+    def close(self):
+        pass
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        # Loaded from the database, so the outbox snapshot is taken.
+        self.product = models.Product.objects.get(
+            pk=create_products(1, inventory=10, unit_price=5)[0].pk
+        )
+
+    def payloads(self):
+        return list(
+            models.OutboxEvent.objects.order_by("id").values_list("topic", "payload")
+        )
+
+    def dispatch(self, *args):
+        call_command("dispatch_outbox", *args, stdout=StringIO())
+
+    def test_save_writes_events_for_changed_fields(self):
+        self.product.inventory = 4
+        self.product.unit_price = Decimal("7.50")
+        self.product.save()
+
+        self.assertEqual(
+            self.payloads(),
+            [
+                (
+                    models.OutboxEvent.TOPIC_PRODUCT_INVENTORY,
+                    {"id": self.product.pk, "inventory": 4, "previous_inventory": 10},
+                ),
+                (
+                    models.OutboxEvent.TOPIC_PRODUCT_PRICE,
+                    {
+                        "id": self.product.pk,
+                        "unit_price": 7.5,
+                        "previous_unit_price": 5.0,
+                    },
+                ),
+            ],
+        )
+
+    def test_save_without_changes_writes_no_event(self):
+        self.product.description = "Same inventory and price"
+        self.product.save()
+
+        self.assertEqual(self.payloads(), [])
+
+    def test_event_and_save_share_a_transaction(self):
+        self.product.inventory = 4
+        with mock.patch.object(
+            models.OutboxEvent.objects, "bulk_create", side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                self.product.save()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 10)
+
+    def test_rollback_drops_the_event(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.product.inventory = 4
+                self.product.save()
+                raise RuntimeError
+
+        self.assertEqual(self.payloads(), [])
+
+    def test_bulk_inventory_changes_use_the_save_payload(self):
+        models.Product.objects.adjust_inventory({self.product.pk: -3})
+        models.Product.objects.filter(pk=self.product.pk).clear_inventory()
+
+        self.assertEqual(
+            [payload for topic, payload in self.payloads()],
+            [
+                {"id": self.product.pk, "inventory": 7, "previous_inventory": 10},
+                {"id": self.product.pk, "inventory": 0, "previous_inventory": 7},
+            ],
+        )
+
+    def test_dispatch_deletes_only_delivered_events(self):
+        models.Product.objects.adjust_inventory({self.product.pk: -1})
+        models.Product.objects.adjust_inventory({self.product.pk: -1})
+        models.Product.objects.adjust_inventory({self.product.pk: -1})
+        event_ids = list(
+            models.OutboxEvent.objects.order_by("id").values_list("id", flat=True)
+        )
+        FailingSecondBatchSink.batches = []
+
+        with self.assertRaises(CommandError):
+            self.dispatch(
+                "--sink", "store.tests.FailingSecondBatchSink", "--batch-size", "2"
+            )
+
+        self.assertEqual(
+            [event["id"] for event in FailingSecondBatchSink.batches[0]],
+            event_ids[:2],
+        )
+        self.assertEqual(
+            list(models.OutboxEvent.objects.values_list("id", flat=True)),
+            event_ids[2:],
+        )
+
+    def test_dispatch_to_a_file(self):
+        models.Product.objects.adjust_inventory({self.product.pk: -1})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "outbox.ndjson")
+            self.dispatch("--path", path)
+            with open(path) as events_file:
+                events = [json.loads(line) for line in events_file]
+
+        self.assertEqual(
+            [event["payload"] for event in events],
+            [{"id": self.product.pk, "inventory": 9, "previous_inventory": 10}],
+        )
+        self.assertFalse(models.OutboxEvent.objects.exists())
+
+    def test_failed_deliveries_keep_the_events(self):
+        models.Product.objects.adjust_inventory({self.product.pk: -1})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "outbox.ndjson")
+            with mock.patch("store.outbox.os.fsync", side_effect=OSError("Disk full")):
+                with self.assertRaises(CommandError):
+                    self.dispatch("--path", path)
+        with mock.patch(
+            "store.outbox.urllib.request.urlopen",
+            side_effect=URLError("Connection refused"),
+        ):
+            with self.assertRaises(CommandError):
+                self.dispatch("--sink", "http")
+
+        self.assertEqual(models.OutboxEvent.objects.count(), 1)
+
+
+class BulkPricingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer.user.is_staff = True
+        self.customer.user.save()
+        self.shirts = create_products(2, unit_price=10)
+        self.hats = create_products(2, unit_price=20)
+        self.discount = models.Discount.objects.create(discount=10, description="Sale")
+
+    def post(self, data, **filters):
+        return self.client.post(
+            f"/store/products/bulk-pricing/?{urlencode(filters)}", data, format="json"
+        )
+
+    def prices(self):
+        return list(
+            models.Product.objects.order_by("id").values_list("unit_price", flat=True)
+        )
+
+    def test_sets_prices_by_ids(self):
+        response = self.post(
+            {"ids": [self.shirts[0].pk, self.hats[0].pk], "unit_price": "12.50"}
+        )
+
+        self.assertEqual(response.data, {"price_updated": 2, "discount_attached": 0})
+        self.assertEqual(self.prices(), [Decimal("12.50"), 10, Decimal("12.50"), 20])
+
+    def test_changes_prices_by_percent_over_a_filter(self):
+        response = self.post({"percent": "-15"}, categories=self.hats[0].category_id)
+
+        self.assertEqual(response.data, {"price_updated": 2, "discount_attached": 0})
+        self.assertEqual(self.prices(), [10, 10, 17, 17])
+
+    def test_attaches_discounts_by_ids_and_filter(self):
+        response = self.post({"ids": [self.shirts[0].pk], "discount": self.discount.pk})
+        self.assertEqual(response.data, {"price_updated": 0, "discount_attached": 1})
+
+        # Products that already have the discount aren't counted again.
+        response = self.post({"discount": self.discount.pk}, price_max=15)
+        self.assertEqual(response.data, {"price_updated": 0, "discount_attached": 1})
+
+        self.assertEqual(
+            set(self.discount.product_set.values_list("pk", flat=True)),
+            {product.pk for product in self.shirts},
+        )
+
+    def test_requires_ids_or_a_filter(self):
+        response = self.post({"unit_price": "5"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.data)
+        self.assertEqual(self.prices(), [10, 10, 20, 20])
+
+    def test_rejects_prices_past_the_maximum(self):
+        models.Product.objects.filter(pk=self.hats[0].pk).update(unit_price=9000)
+
+        response = self.post({"percent": "12"}, categories=self.hats[0].category_id)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("percent", response.data)
+        self.assertEqual(self.prices(), [10, 10, 9000, 20])
+
+    def test_price_changes_publish_previous_prices(self):
+        self.post({"ids": [product.pk for product in self.shirts], "percent": "10"})
+        # Setting a price products already have changes nothing.
+        self.post({"ids": [self.hats[0].pk], "unit_price": "20"})
+
+        self.assertEqual(
+            list(
+                models.OutboxEvent.objects.order_by("id").values_list(
+                    "topic", "payload"
+                )
+            ),
+            [
+                (
+                    models.OutboxEvent.TOPIC_PRODUCT_PRICE,
+                    {"id": product.pk, "unit_price": 11.0, "previous_unit_price": 10.0},
+                )
+                for product in self.shirts
+            ],
+        )
+
+    def test_facets_cache_is_cleared_once_on_commit(self):
+        cache.set(models.Product.FACETS_CACHE_KEY, "stale")
+
+        with mock.patch.object(models.Product, "PRICE_UPDATE_CHUNK_SIZE", 1):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                response = self.post({"percent": "5"}, price_min=0)
+                self.assertEqual(response.data["price_updated"], 4)
+                self.assertEqual(cache.get(models.Product.FACETS_CACHE_KEY), "stale")
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNone(cache.get(models.Product.FACETS_CACHE_KEY))
+
+
+class ProductSlugTests(TestCase):
+    def setUp(self):
+        self.product = models.Product.objects.create(
+            name="Blue Shirt",
+            description="",
+            unit_price=5,
+            inventory=10,
+            category=models.Category.objects.create(title="Category"),
+        )
+
+    def test_saves_keep_the_slug(self):
+        for _ in range(2):
+            self.product.unit_price += 1
+            self.product.save()
+            self.product.refresh_from_db()
+            self.assertEqual(self.product.slug, "blue-shirt")
+
+    def test_renames_regenerate_a_unique_slug(self):
+        models.Product.objects.create(
+            name="Red Hat",
+            description="",
+            unit_price=5,
+            inventory=10,
+            category=self.product.category,
+        )
+        self.product.name = "Red Hat"
+        self.product.save()
+
+        self.assertEqual(self.product.slug, "red-hat-1")
+
+
+@override_settings(DATABASE_REPLICAS=["replica"], DATABASE_REPLICA_LAG_CHECK_INTERVAL=0)
+class PrimaryReplicaRouterTests(APITestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        super().setUp()
+        # Two products on the primary and one on the replica, so the count
+        # shows which database served the list.
+        create_products(2)
+        category = models.Category.objects.using("replica").create(title="Replica")
+        models.Product.objects.using("replica").create(
+            name="Replica product",
+            slug="replica-product",
+            description="",
+            unit_price=5,
+            inventory=10,
+            category=category,
+        )
+
+    def products_count(self, **headers):
+        response = self.client.get("/store/products/", **headers)
+        self.assertEqual(response.status_code, 200)
+        return response.data["count"]
+
+    def test_safe_reads_go_to_the_replica(self):
+        self.assertEqual(self.products_count(), 1)
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        response = self.client.post("/store/carts/")
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(routers.PIN_HEADER, response.headers)
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+
+        self.assertEqual(self.products_count(), 2)
+
+        self.client.cookies.clear()
+        self.assertEqual(self.products_count(), 1)
+        self.assertEqual(
+            self.products_count(
+                HTTP_X_PRIMARY_PIN=response.headers[routers.PIN_HEADER]
+            ),
+            2,
+        )
+
+    def test_lagging_or_unreachable_replicas_fall_back_to_the_primary(self):
+        for patch in [
+            {"return_value": 60},
+            {"return_value": None},
+            {"side_effect": DatabaseError},
+        ]:
+            with self.subTest(**patch):
+                with mock.patch("store.routers.get_replica_lag", **patch):
+                    self.assertEqual(self.products_count(), 2)
+
+
+class WarmCacheTests(TransactionTestCase):
+    def warm_cache(self):
+        stdout, stderr = StringIO(), StringIO()
+        call_command(
+            "warm_cache",
+            urls=["/store/products/?facets=true"],
+            workers=1,
+            stdout=stdout,
+            stderr=stderr,
+        )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_reports_the_facets_key(self):
+        create_products(3)
+        cache.delete(models.Product.FACETS_CACHE_KEY)
+
+        stdout, stderr = self.warm_cache()
+
+        self.assertIn(f"cache keys set: {models.Product.FACETS_CACHE_KEY}.", stdout)
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+    )
+    def test_warns_when_workers_cant_share_the_cache(self):
+        stdout, stderr = self.warm_cache()
+
+        self.assertIn("DummyCache", stderr)
+        self.assertIn("cache keys set: none.", stdout)
+
+
+class AdminChangelistQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser(
+            username="admin", email="admin@example.com", password="secret"
+        )
+        products = create_products(12)
+        customers = [create_customer(f"customer{i}") for i in range(6)]
+        for customer in customers:
+            order = models.Order.objects.create(customer=customer)
+            models.OrderItem.objects.bulk_create(
+                [
+                    models.OrderItem(
+                        order=order,
+                        product=product,
+                        product_name=product.name,
+                        quantity=1,
+                        unit_price=product.unit_price,
+                    )
+                    for product in products[:3]
+                ]
+            )
+        models.Comment.objects.bulk_create(
+            [
+                models.Comment(product=product, name="Reader", body="Nice")
+                for product in products
+            ]
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelists_run_a_fixed_number_of_queries(self):
+        # Session, user, count and one page of rows with their related
+        # objects, whatever the page size.
+        for url in [
+            "/admin/store/product/",
+            "/admin/store/order/",
+            "/admin/store/customer/",
+            "/admin/store/comment/",
+            "/admin/store/orderitem/",
+        ]:
+            with self.subTest(url=url):
+                with self.assertNumQueries(4):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(
+            username="admin", email="admin@example.com", password="secret"
+        )
+        self.client.force_login(self.admin)
+        customer = create_customer()
+        self.order = models.Order.objects.create(customer=customer)
+        self.archived_order = models.ArchivedOrder.objects.create(
+            id=self.order.pk + 1000,
+            customer=customer,
+            datetime_created=timezone.now() - timedelta(days=400),
+            status=models.Order.ORDER_STATUS_PAID,
+        )
+
+    def export(self, **params):
+        response = self.client.get("/admin/store/order/export/", params)
+        self.assertEqual(response.status_code, 200)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        return [int(line.split(",")[0]) for line in lines[1:]]
+
+    def test_export_includes_archived_orders(self):
+        self.assertEqual(self.export(), [self.order.pk, self.archived_order.pk])
+
+    def test_export_filters_archived_orders_by_date(self):
+        month_ago = (timezone.now() - timedelta(days=30)).isoformat()
+
+        self.assertEqual(self.export(datetime_created__gte=month_ago), [self.order.pk])
+        self.assertEqual(
+            self.export(datetime_created__lt=month_ago), [self.archived_order.pk]
+        )
+
+
+class CustomerSearchTests(TestCase):
+    def setUp(self):
+        self.customer = create_customer("jose", first_name="José", last_name="Ruiz")
+        self.customer.phone_number = "+98 912-345-6789"
+        self.customer.save()
+        self.other = create_customer("sara", first_name="Sara", last_name="Diaz")
+
+    def search(self, query):
+        return list(
+            models.Customer.objects.filter(
+                pk__in=models.CustomerSearchTerm.search(query)
+            ).values_list("pk", flat=True)
+        )
+
+    def test_matches_name_email_and_phone_prefixes(self):
+        for query in [
+            "jos",
+            "RUIZ",
+            "ruiz",
+            "jose ru",
+            "jose@example",
+            "0912 345 6789",
+            "+98912345678",
+            "09123456789",
+        ]:
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), [self.customer.pk])
+
+    def test_renames_are_reindexed(self):
+        self.customer.user.last_name = "Diaz"
+        self.customer.user.save(update_fields=["last_name"])
+
+        self.assertEqual(
+            sorted(self.search("diaz")), sorted([self.customer.pk, self.other.pk])
+        )
+        self.assertEqual(self.search("ruiz"), [])
@@ -0,0 +1,9 @@
+import unicodedata
+
+
+def normalize(text):
+    if text.isascii():
+        return " ".join(text.lower().split())
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.split())
@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle, SimpleRateThrottle
+
+MAX_LOCAL_BUCKETS = 10000
+
+_buckets = OrderedDict()
+_buckets_lock = threading.Lock()
+
+
+@lru_cache
+def parse_rate(rate):
+    num_requests, duration = SimpleRateThrottle.parse_rate(None, rate)
+    return duration / num_requests, num_requests
+
+
+class TokenBucket:
+    """
+    Token bucket stored as its theoretical arrival time (GCRA).
+
+    Requests are admitted against the process-local state; the shared
+    state in the cache is advanced in batches of THROTTLE_SYNC_BATCH
+    requests or every THROTTLE_SYNC_INTERVAL seconds, so other processes'
+    traffic is picked up without a cache round trip per request.
+    """
+
+    def __init__(self, key, emission_interval, capacity):
+        self.key = key
+        self.emission_interval = emission_interval
+        self.tolerance = emission_interval * capacity
+        self.timeout = int(self.tolerance) + 60
+        self.tat = 0.0
+        self.pending = 0
+        self.synced_at = 0.0
+        self.lock = threading.Lock()
+
+    def consume(self, now):
+        """Takes a token and returns 0, or returns the seconds to wait."""
+        with self.lock:
+            tat = max(self.tat, now) + self.emission_interval
+            if tat - now > self.tolerance:
+                return tat - now - self.tolerance
+            self.tat = tat
+            self.pending += 1
+            if (
+                self.pending >= settings.THROTTLE_SYNC_BATCH
+                or now - self.synced_at >= settings.THROTTLE_SYNC_INTERVAL
+            ):
+                self.sync(now)
+            return 0
+
+    def sync(self, now):
+        now_ms = int(now * 1000)
+        delta = round(self.pending * self.emission_interval * 1000)
+        if cache.add(self.key, now_ms + delta, self.timeout):
+            shared_tat = now_ms + delta
+        else:
+            try:
+                shared_tat = cache.incr(self.key, delta)
+            except ValueError:
+                shared_tat = None
+            if shared_tat is None or shared_tat - delta < now_ms:
+                # The shared bucket has refilled since anyone last wrote to it.
+                shared_tat = now_ms + delta
+                cache.set(self.key, shared_tat, self.timeout)
+        self.tat = max(self.tat, shared_tat / 1000)
+        self.pending = 0
+        self.synced_at = now
+
+
+def get_bucket(key, rate):
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = TokenBucket(key, *parse_rate(rate))
+            if len(_buckets) > MAX_LOCAL_BUCKETS:
+                _buckets.popitem(last=False)
+        else:
+            _buckets.move_to_end(key)
+    return bucket
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Rates come from REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"] keyed by
+    scope, e.g. "60/min" is a bucket of 60 tokens refilled one per second.
+    """
+
+    scope = None
+    wait_seconds = None
+
+    def get_scope(self, request, view):
+        return self.scope
+
+    def get_bucket_ident(self, request):
+        raise NotImplementedError(".get_bucket_ident() must be overridden")
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if rate is None:
+            return True
+        ident = self.get_bucket_ident(request)
+        if ident is None:
+            return True
+
+        bucket = get_bucket(f"throttle:{scope}:{ident}", rate)
+        self.wait_seconds = bucket.consume(time.time())
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class AnonTokenBucketThrottle(TokenBucketThrottle):
+    scope = "anon"
+
+    def get_bucket_ident(self, request):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    scope = "user"
+
+    def get_bucket_ident(self, request):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class ScopedWriteTokenBucketThrottle(TokenBucketThrottle):
+    """Per-route bucket for writes, named by the view's `throttle_scope`."""
+
+    def get_scope(self, request, view):
+        if request.method in SAFE_METHODS:
+            return None
+        return getattr(view, "throttle_scope", None)
+
+    def get_bucket_ident(self, request):
+        if request.user and request.user.is_authenticated:
+            return f"user-{request.user.pk}"
+        return f"anon-{self.get_ident(request)}"
@@ -11,6 +11,7 @@ router.register("categories", views.CategoryViewSet, basename="category")
 router.register("carts", views.CartViewSet, basename="cart")
 router.register("customers", views.CustomerViewSet, basename="customer")
 router.register("orders", views.OrderViewSet, basename="order")
+router.register("comments", views.CommentModerationViewSet, basename="comment")
 
 # store/products/product=1/comments/10
 products_router = routers.NestedDefaultRouter(router, "products", lookup="product")
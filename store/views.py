@@ -1,6 +1,17 @@
+import hashlib
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
 from django.forms import ValidationError
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, F, Prefetch
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Prefetch, Q
 from rest_framework.decorators import api_view
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -26,29 +37,327 @@ from rest_framework.permissions import (
     IsAuthenticatedOrReadOnly,
     AllowAny,
     DjangoModelPermissions,
+    SAFE_METHODS,
 )
 
 from django_filters.rest_framework import DjangoFilterBackend
 
-from . import models, serializers, filters, paginations, permissions
+from . import (
+    archive,
+    autocomplete,
+    models,
+    serializers,
+    filters,
+    paginations,
+    permissions,
+)
+
+
+class ConditionalGetMixin:
+    def get_conditional_response(
+        self, request, get_response, validators, last_modified=None
+    ):
+        etag = quote_etag(
+            hashlib.md5(
+                repr(
+                    (
+                        request.get_full_path(),
+                        request.accepted_renderer.format,
+                        *validators,
+                    )
+                ).encode()
+            ).hexdigest()
+        )
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = get_response()
+        if response.status_code in [status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED]:
+            response.headers["ETag"] = etag
+            if last_modified:
+                response.headers["Last-Modified"] = http_date(last_modified)
+        return response
+
+
+class SparseFieldsetMixin:
+    # Model fields read by each serializer field and ?expand= path, so safe
+    # requests only select, join and prefetch what the response shows.
+    sparse_fieldset_sources = {}
+    sparse_fieldset_prefetches = {}
+    expand_sources = {}
+    expand_prefetches = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+
+        serializer_class = self.get_serializer_class()
+        fieldset = serializers.get_sparse_fieldset(
+            self.request, serializer_class.Meta.fields
+        )
+        expand_paths = [
+            path
+            for path in self.get_expand_paths(serializer_class)
+            if path.split(".")[0] in fieldset
+        ]
+        sources = ["id"]
+        prefetches = {}
+        for field_name in fieldset:
+            sources += self.sparse_fieldset_sources.get(field_name, [])
+            for prefetch in self.sparse_fieldset_prefetches.get(field_name, []):
+                prefetches[getattr(prefetch, "prefetch_to", prefetch)] = prefetch
+        for path in expand_paths:
+            sources += self.expand_sources.get(path, [])
+            for prefetch in self.expand_prefetches.get(path, []):
+                prefetches[getattr(prefetch, "prefetch_to", prefetch)] = prefetch
+        related = {source.rsplit("__", 1)[0] for source in sources if "__" in source}
+        if related:
+            queryset = queryset.select_related(*related)
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches.values())
+        return queryset.only(*sources)
+
+    def get_expand_paths(self, serializer_class=None):
+        serializer_class = serializer_class or self.get_serializer_class()
+        if not issubclass(serializer_class, serializers.ExpandableFieldsMixin):
+            return []
+        return list(
+            serializers.get_expand_paths(
+                serializers.get_expand_tree(
+                    self.request, serializer_class.max_expand_depth
+                )
+            )
+        )
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(SparseFieldsetMixin, ConditionalGetMixin, ModelViewSet):
     serializer_class = serializers.ProductSerializer
-    queryset = models.Product.objects.select_related("category").all().order_by("-id")
+    queryset = models.Product.objects.all().order_by("-id")
+    sparse_fieldset_sources = {
+        "name": ["name"],
+        "unit_price": ["unit_price"],
+        "unit_price_after_tax": ["unit_price"],
+        "inventory": ["inventory"],
+        "category": ["category"],
+        "description": ["description"],
+    }
+    expand_sources = {
+        "category": ["category__title", "category__description"],
+    }
     filter_backends = [
         SearchFilter,
         DjangoFilterBackend,
     ]
     search_fields = ["name", "category__title"]
     filterset_class = filters.ProductFilter
-    pagination_class = PageNumberPagination
+    pagination_class = paginations.KnownCountPagination
     PageNumberPagination.page_size = 10
     permission_classes = [permissions.IsAdminOrReadOnly]
+    lookup_value_regex = "[0-9]+"
 
     def get_serializer_context(self):
         return {"request": self.request}
 
+    def list(self, request, *args, **kwargs):
+        # Embedded categories carry no modification time to validate against.
+        if self.get_expand_paths():
+            return self.list_with_facets(request, *args, **kwargs)
+        summary = self.filter_queryset(self.get_queryset()).aggregate(
+            last_modified=Max("datetime_modified"),
+            products_count=Count("id"),
+        )
+        self.paginator.known_count = summary["products_count"]
+        validators = [summary["last_modified"], summary["products_count"]]
+        if self.requests_facets():
+            # Facets show category titles, which products don't track.
+            validators.append(
+                list(models.Category.objects.order_by("pk").values_list("pk", "title"))
+            )
+        # No Last-Modified: deleting a product doesn't move the newest
+        # modification time forward, so If-Modified-Since alone would get a
+        # stale 304. The ETag covers deletes through the count.
+        return self.get_conditional_response(
+            request,
+            lambda: self.list_with_facets(request, *args, **kwargs),
+            validators=validators,
+        )
+
+    def requests_facets(self):
+        return self.request.query_params.get("facets") in ["1", "true"]
+
+    def list_with_facets(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if self.requests_facets():
+            response.data["facets"] = self.get_facets()
+        return response
+
+    @action(detail=False)
+    def autocomplete(self, request):
+        try:
+            limit = int(request.query_params.get("limit", 10))
+        except ValueError:
+            limit = 10
+        limit = max(1, min(limit, autocomplete.MAX_RESULTS))
+        return Response(
+            autocomplete.get_index().search(request.query_params.get("q", ""), limit)
+        )
+
+    @action(detail=False, url_path="low-stock", permission_classes=[IsAdminUser])
+    def low_stock(self, request):
+        query = serializers.LowStockQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        queryset = (
+            models.Product.objects.filter(
+                stock_level=models.Product.STOCK_LEVEL_LOW,
+                stock_level_changed_at__gte=query.validated_data["since"],
+            )
+            .order_by("stock_level_changed_at", "id")
+            .only(*serializers.StockLevelProductSerializer.Meta.fields)
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = serializers.StockLevelProductSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, url_path="stock-levels", permission_classes=[IsAdminUser])
+    def stock_levels(self, request):
+        serializer = serializers.StockLevelCountSerializer(
+            models.StockLevelCount.objects.order_by("stock_level"), many=True
+        )
+        return Response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=["POST"],
+        url_path="bulk-pricing",
+        permission_classes=[IsAdminUser],
+    )
+    def bulk_pricing(self, request):
+        serializer = serializers.ProductBulkPricingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        if "ids" in data:
+            queryset = models.Product.objects.filter(pk__in=data["ids"])
+        else:
+            filterset = filters.ProductFilter(
+                request.query_params, queryset=models.Product.objects.all()
+            )
+            if not filterset.form.has_changed():
+                return Response(
+                    {"error": "provide a list of product ids or at least one filter."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if not filterset.is_valid():
+                return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+            queryset = filterset.qs.order_by()
+
+        percent = data.get("percent")
+        if percent is not None and percent > 0:
+            # Checked up front since MySQL rejects an out-of-range DECIMAL;
+            # anything reaching the half cent above the maximum rounds past it.
+            max_price = (models.Product.MAX_UNIT_PRICE + Decimal("0.005")) * 100
+            if queryset.filter(unit_price__gte=max_price / (100 + percent)).exists():
+                return Response(
+                    {
+                        "percent": [
+                            f"Some prices would exceed {models.Product.MAX_UNIT_PRICE}."
+                        ]
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        result = {"price_updated": 0, "discount_attached": 0}
+        with transaction.atomic():
+            if "unit_price" in data or percent:
+                result["price_updated"] = queryset.update_unit_prices(
+                    unit_price=data.get("unit_price"), percent=percent
+                )
+            if "discount" in data:
+                result["discount_attached"] = queryset.attach_discount(data["discount"])
+        return Response(result)
+
+    def get_facets(self):
+        is_unfiltered = not set(self.request.query_params) - {
+            "page",
+            "facets",
+            "fields",
+            "omit",
+            "expand",
+            "ordering",
+        }
+        if is_unfiltered:
+            facets = cache.get(models.Product.FACETS_CACHE_KEY)
+            if facets is not None:
+                return facets
+
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        categories = (
+            queryset.values("category_id", "category__title")
+            .annotate(products_count=Count("id"))
+            .order_by("-products_count")
+        )
+        bounds = settings.PRODUCT_PRICE_FACET_BUCKETS
+        price_ranges = [
+            (bounds[i], bounds[i + 1] if i + 1 < len(bounds) else None)
+            for i in range(len(bounds))
+        ]
+        price_counts = queryset.aggregate(
+            **{
+                f"bucket_{i}": Count(
+                    "id",
+                    filter=Q(unit_price__gte=low)
+                    & (Q(unit_price__lt=high) if high is not None else Q()),
+                )
+                for i, (low, high) in enumerate(price_ranges)
+            }
+        )
+        stock_counts = queryset.aggregate(
+            in_stock=Count("id", filter=Q(inventory__gt=0)),
+            out_of_stock=Count("id", filter=Q(inventory__lte=0)),
+        )
+
+        facets = {
+            "categories": [
+                {
+                    "id": category["category_id"],
+                    "title": category["category__title"],
+                    "count": category["products_count"],
+                }
+                for category in categories
+            ],
+            "price": [
+                {"min": low, "max": high, "count": price_counts[f"bucket_{i}"]}
+                for i, (low, high) in enumerate(price_ranges)
+            ],
+            "inventory": stock_counts,
+        }
+        if is_unfiltered:
+            cache.set(
+                models.Product.FACETS_CACHE_KEY,
+                facets,
+                settings.PRODUCT_FACETS_CACHE_TIMEOUT,
+            )
+        return facets
+
+    def retrieve(self, request, *args, **kwargs):
+        last_modified = (
+            models.Product.objects.filter(pk=kwargs["pk"])
+            .values_list("datetime_modified", flat=True)
+            .first()
+        )
+        if last_modified is None or self.get_expand_paths():
+            return super().retrieve(request, *args, **kwargs)
+        return self.get_conditional_response(
+            request,
+            lambda: super(ProductViewSet, self).retrieve(request, *args, **kwargs),
+            validators=[last_modified],
+            last_modified=last_modified,
+        )
+
     def destroy(self, request, pk):
         product = get_object_or_404(
             models.Product.objects.select_related(
@@ -56,13 +365,7 @@ class ProductViewSet(ModelViewSet):
             ),
             pk=pk,
         )
-        if product.order_items.count() > 0:
-            return Response(
-                {
-                    "error": "there is some order items including this product. please remove them first."
-                },
-                status=status.HTTP_405_METHOD_NOT_ALLOWED,
-            )
+        # Order items keep their own copy of the product's name and slug.
         product.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -99,25 +402,107 @@ class CategoryViewSet(ModelViewSet):
 
 class CommentViewSet(ModelViewSet):
     serializer_class = serializers.CommentSerializer
+    pagination_class = paginations.CommentCursorPagination
     # queryset = models.Comment.objects.all()
 
     def get_queryset(self):
         product_pk = self.kwargs["product_pk"]
-        return models.Comment.objects.select_related("product").filter(
-            product_id=product_pk
-        )
+        if self.request.method in SAFE_METHODS:
+            return models.Comment.approved.filter(product_id=product_pk)
+        return models.Comment.objects.filter(product_id=product_pk)
 
     def get_serializer_context(self):
         return {"product_pk": self.kwargs["product_pk"]}
 
 
+class CommentModerationViewSet(
+    ListModelMixin, RetrieveModelMixin, UpdateModelMixin, GenericViewSet
+):
+    http_method_names = [
+        "get",
+        "post",
+        "patch",
+        "options",
+        "head",
+    ]
+    serializer_class = serializers.CommentModerationSerializer
+    pagination_class = paginations.CommentModerationCursorPagination
+    permission_classes = [IsAdminUser]
+
+    def get_queryset(self):
+        queryset = models.Comment.objects.all()
+        if self.action != "list":
+            return queryset
+
+        comment_status = self.request.query_params.get(
+            "status", models.Comment.COMMENT_STATUS_WAITING
+        )
+        queryset = queryset.filter(status=comment_status)
+        product_pk = self.request.query_params.get("product")
+        if product_pk:
+            queryset = queryset.filter(product_id=product_pk)
+        return queryset
+
+    @action(detail=False, methods=["POST"])
+    def claim(self, request):
+        serializer = serializers.CommentClaimSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        comments = models.Comment.objects.claim(
+            request.user, serializer.validated_data["count"]
+        )
+        return Response(
+            serializers.CommentModerationSerializer(comments, many=True).data
+        )
+
+    @action(detail=False, methods=["POST"])
+    def moderate(self, request):
+        serializer = serializers.CommentModerateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        moderated_count = models.Comment.objects.moderate(
+            request.user,
+            approved_ids=serializer.validated_data["approve"],
+            rejected_ids=serializer.validated_data["reject"],
+        )
+        return Response({"moderated": moderated_count})
+
+
 class CartViewSet(
-    CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, GenericViewSet
+    SparseFieldsetMixin,
+    ConditionalGetMixin,
+    CreateModelMixin,
+    RetrieveModelMixin,
+    DestroyModelMixin,
+    GenericViewSet,
 ):
     serializer_class = serializers.CartSerializer
-    queryset = models.Cart.objects.prefetch_related("items__product")
+    queryset = models.Cart.objects.all()
+    sparse_fieldset_prefetches = {
+        "items": [
+            Prefetch(
+                "items__product",
+                queryset=models.Product.objects.only("name", "unit_price"),
+            )
+        ],
+    }
+    sparse_fieldset_prefetches["total_price_cart"] = sparse_fieldset_prefetches["items"]
+    throttle_scope = "carts"
     lookup_value_regex = "[0-9a-fA-F]{8}\-?[0-9a-fA-F]{4}\-?[0-9a-fA-F]{4}\-?[0-9a-fA-F]{4}\-?[0-9a-fA-F]{12}"
 
+    def retrieve(self, request, *args, **kwargs):
+        validators = (
+            models.Cart.objects.filter(pk=kwargs["pk"])
+            .annotate(products_modified=Max("items__product__datetime_modified"))
+            .values_list("version", "products_modified")
+            .first()
+        )
+        if validators is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self.get_conditional_response(
+            request,
+            lambda: super(CartViewSet, self).retrieve(request, *args, **kwargs),
+            validators=validators,
+        )
+
 
 class CartItemViewSet(ModelViewSet):
     http_method_names = [
@@ -126,6 +511,7 @@ class CartItemViewSet(ModelViewSet):
         "patch",
         "delete",
     ]
+    throttle_scope = "carts"
     # serializer_class = serializers.CartItemSerializer
 
     def get_queryset(self):
@@ -147,11 +533,21 @@ class CartItemViewSet(ModelViewSet):
         return {"cart_pk": self.kwargs["cart_pk"]}
 
 
-class CustomerViewSet(ModelViewSet):
+class CustomerViewSet(SparseFieldsetMixin, ModelViewSet):
 
     serializer_class = serializers.CustomerSerializer
-    queryset = models.Customer.objects.select_related("user").all()
+    queryset = models.Customer.objects.all()
+    sparse_fieldset_sources = {
+        "username": ["user__username"],
+        "full_name": ["user__first_name", "user__last_name"],
+        "phone_number": ["phone_number"],
+        "birth_date": ["birth_date"],
+    }
     permission_classes = [IsAdminUser]
+    filter_backends = [
+        DjangoFilterBackend,
+    ]
+    filterset_class = filters.CustomerFilter
 
     @action(detail=False, methods=["GET", "PUT"], permission_classes=[IsAuthenticated])
     def me(self, request):
@@ -168,14 +564,57 @@ class CustomerViewSet(ModelViewSet):
 
     @action(
         detail=True,
+        methods=["POST"],
         permission_classes=[permissions.SendPrivateEmailToCustomerPermission],
     )
     def send_private_email(self, request, pk):
-        return Response(f"Sending email to customer {pk=}")
+        customer = self.get_object()
+        return self.enqueue_private_email(
+            request, models.Customer.objects.filter(pk=customer.pk)
+        )
 
+    @action(
+        detail=False,
+        methods=["POST"],
+        permission_classes=[permissions.SendPrivateEmailToCustomerPermission],
+    )
+    def send_private_email_to_all(self, request):
+        return self.enqueue_private_email(
+            request, self.filter_queryset(self.get_queryset())
+        )
 
-class OrderViewSet(ModelViewSet):
+    def enqueue_private_email(self, request, customers):
+        serializer = serializers.PrivateEmailSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            email = serializer.save()
+            queued_count = email.enqueue(customers)
+        return Response(
+            {"id": email.id, "queued": queued_count},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class OrderViewSet(SparseFieldsetMixin, ModelViewSet):
     # permission_classes = [IsAuthenticated]
+    queryset = models.Order.objects.all()
+    sparse_fieldset_sources = {
+        "customer": [
+            "customer__phone_number",
+            "customer__birth_date",
+            "customer__user__first_name",
+            "customer__user__last_name",
+            "customer__user__email",
+        ],
+        "status": ["status"],
+        "datetime_created": ["datetime_created"],
+    }
+    sparse_fieldset_prefetches = {
+        "items": ["items"],
+    }
+    expand_prefetches = {
+        "items.product": ["items"],
+    }
     http_method_names = [
         "get",
         "post",
@@ -185,24 +624,74 @@ class OrderViewSet(ModelViewSet):
         "head",
     ]
 
+    filter_backends = [
+        DjangoFilterBackend,
+    ]
+    filterset_class = filters.OrderFilter
+    throttle_scope = "orders"
+
     def get_permissions(self):
-        if self.request.method in ["PATCH", "DELETE"]:
+        if self.request.method in ["PATCH", "DELETE"] or self.action == "transition":
             return [IsAdminUser()]
         return [IsAuthenticated()]
 
     def get_queryset(self):
-        queryset = models.Order.objects.select_related(
+        queryset = super().get_queryset()
+        if self.request.user.is_staff:
+            return queryset
+
+        return queryset.filter(customer__user_id=self.request.user.id)
+
+    def get_archive_queryset(self):
+        queryset = models.ArchivedOrder.objects.select_related(
             "customer__user"
-        ).prefetch_related(
-            Prefetch(
-                "items", queryset=models.OrderItem.objects.select_related("product")
-            )
-        )
+        ).prefetch_related("items")
         if self.request.user.is_staff:
             return queryset
 
         return queryset.filter(customer__user_id=self.request.user.id)
 
+    def reads_archive(self):
+        # Archived orders are only read when the ?created range reaches back
+        # past the archive cutoff, so everyday lists stay on the hot table.
+        filterset = filters.OrderFilter(
+            self.request.query_params, queryset=models.Order.objects.none()
+        )
+        if not filterset.is_valid():
+            return False
+        created = filterset.form.cleaned_data.get("created")
+        return bool(created) and (
+            created.start is None or created.start < models.ArchivedOrder.get_cutoff()
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not self.reads_archive():
+            return super().list(request, *args, **kwargs)
+
+        orders = archive.HotArchiveUnion(
+            self.filter_queryset(self.get_queryset()),
+            filters.OrderFilter(
+                request.query_params, queryset=self.get_archive_queryset()
+            ).qs,
+        )
+        page = self.paginate_queryset(orders)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        return Response(self.get_serializer(orders, many=True).data)
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.request.method not in SAFE_METHODS:
+                raise
+        order = get_object_or_404(
+            self.get_archive_queryset(), pk=self.kwargs[self.lookup_field]
+        )
+        self.check_object_permissions(self.request, order)
+        return order
+
     def get_serializer_class(self):
         if self.request.method == "POST":
             return serializers.OrderCreateSerializer
@@ -215,9 +704,104 @@ class OrderViewSet(ModelViewSet):
         return serializers.OrderSerializer
 
     def get_serializer_context(self):
-        return {"user_id": self.request.user.id}
+        return {"user_id": self.request.user.id, "request": self.request}
+
+    @action(detail=False, methods=["POST"])
+    def transition(self, request):
+        serializer = serializers.OrderStatusTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        order_ids = serializer.validated_data.get("ids")
+        new_status = serializer.validated_data["status"]
+
+        if order_ids is not None:
+            queryset = models.Order.objects.filter(pk__in=order_ids)
+        else:
+            filterset = filters.OrderFilter(
+                request.query_params, queryset=models.Order.objects.all()
+            )
+            if not filterset.form.has_changed():
+                return Response(
+                    {"error": "provide a list of order ids or at least one filter."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if not filterset.is_valid():
+                return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+            queryset = filterset.qs
+
+        previous_statuses, changed_ids = queryset.transition_status(new_status)
+        changed_ids = set(changed_ids)
+        results = [
+            {
+                "id": order_id,
+                "result": (
+                    "changed" if order_id in changed_ids else "invalid_transition"
+                ),
+                "previous_status": previous_status,
+            }
+            for order_id, previous_status in previous_statuses.items()
+        ]
+        if order_ids is not None:
+            results += [
+                {"id": order_id, "result": "not_found", "previous_status": None}
+                for order_id in dict.fromkeys(order_ids)
+                if order_id not in previous_statuses
+            ]
+        return Response(
+            {"status": new_status, "changed": len(changed_ids), "results": results}
+        )
 
     def create(self, request, *args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return self.create_order(request)
+        if len(key) > 255:
+            return Response(
+                {"error": "Idempotency-Key must be at most 255 characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        request_hash = hashlib.sha256(
+            json.dumps(request.data, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        expires_at = timezone.now() + settings.IDEMPOTENCY_KEY_TTL
+        with transaction.atomic():
+            # The insert blocks on the unique (user, key) index while a
+            # concurrent request with the same key is still running, so the
+            # duplicate replays its response instead of checking out twice.
+            try:
+                with transaction.atomic():
+                    idempotency_key = models.IdempotencyKey.objects.create(
+                        user_id=request.user.id,
+                        key=key,
+                        request_hash=request_hash,
+                        expires_at=expires_at,
+                    )
+            except IntegrityError:
+                idempotency_key = models.IdempotencyKey.objects.select_for_update().get(
+                    user_id=request.user.id, key=key
+                )
+                if idempotency_key.expires_at > timezone.now():
+                    if idempotency_key.request_hash != request_hash:
+                        return Response(
+                            {
+                                "error": "this Idempotency-Key was already used with a different request."
+                            },
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                        )
+                    return Response(
+                        idempotency_key.response_body,
+                        status=idempotency_key.response_status,
+                    )
+                idempotency_key.request_hash = request_hash
+                idempotency_key.expires_at = expires_at
+
+            response = self.create_order(request)
+            idempotency_key.response_status = response.status_code
+            idempotency_key.response_body = response.data
+            idempotency_key.save()
+            return response
+
+    def create_order(self, request):
         create_order_serializer = serializers.OrderCreateSerializer(
             data=request.data,
             context={"user_id": self.request.user.id},